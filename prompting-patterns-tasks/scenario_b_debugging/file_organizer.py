@@ -9,13 +9,26 @@ There's a bug that causes it to fail on some file types.
 Practice challenge: Use the "Debugging" prompt pattern to fix the issue
 """
 
+import fnmatch
 import os
 import shutil
+from collections import deque
 from pathlib import Path
 
 class FileOrganizer:
-    def __init__(self, source_dir):
+    def __init__(self, source_dir, recursive=False, max_depth=None, exclude=()):
+        """
+        Args:
+            source_dir: Folder to organize
+            recursive: Also organize files in subfolders (moved up into source_dir's categories)
+            max_depth: How many folder levels below source_dir to descend (None: no limit)
+            exclude: Glob patterns for files and folders to leave alone, matched
+                     against the name and the path relative to source_dir
+        """
         self.source_dir = Path(source_dir)
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.exclude = tuple(exclude)
         self.organized_count = 0
         
         # File type mappings - this has the bug!
@@ -40,6 +53,38 @@ class FileOrganizer:
         # causing issues when files don't match known extensions
         return None
     
+    def is_excluded(self, name, relative_path):
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern)
+                   for pattern in self.exclude)
+    
+    def scan_files(self):
+        """
+        Lazily yield an os.DirEntry for every file to organize
+        
+        Uses os.scandir, whose entries carry the file type from the directory
+        listing, so no extra stat call is needed per file. Folders are walked
+        one at a time (breadth first) and only while files are being consumed.
+        The category folders themselves are skipped.
+        """
+        categories = set(self.file_categories)
+        pending = deque([(str(self.source_dir), '', 0)])
+        while pending:
+            directory, relative_dir, depth = pending.popleft()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative_path = relative_dir + entry.name
+                        if self.exclude and self.is_excluded(entry.name, relative_path):
+                            continue
+                        if entry.is_file():
+                            yield entry
+                        elif (self.recursive and entry.is_dir(follow_symlinks=False)
+                              and (self.max_depth is None or depth < self.max_depth)
+                              and not (depth == 0 and entry.name in categories)):
+                            pending.append((entry.path, relative_path + '/', depth + 1))
+            except OSError as e:
+                print(f"Error scanning {directory}: {e}")
+    
     def create_category_folders(self):
         """Create folders for each category"""
         for category in self.file_categories.keys():
@@ -53,16 +98,18 @@ class FileOrganizer:
         
         self.create_category_folders()
         
-        # Get all files in source directory
-        files = [f for f in self.source_dir.iterdir() if f.is_file()]
-        
-        for file_path in files:
+        # Files are moved as the scan finds them
+        for entry in self.scan_files():
+            file_path = Path(entry.path)
             try:
                 category = self.get_file_category(file_path)
                 
                 # BUG: This will fail when category is None
                 destination_folder = self.source_dir / category
                 destination_path = destination_folder / file_path.name
+                if self.recursive:
+                    # Files from different subfolders can share a name
+                    destination_path = self.unique_path(destination_path)
                 
                 # Move the file
                 shutil.move(str(file_path), str(destination_path))
@@ -74,6 +121,16 @@ class FileOrganizer:
                 continue
         
         print(f"\nOrganized {self.organized_count} files")
+    
+    @staticmethod
+    def unique_path(path):
+        """path, or 'name (1).ext', 'name (2).ext'... if it is already taken"""
+        candidate = path
+        number = 1
+        while candidate.exists():
+            candidate = path.with_name(f"{path.stem} ({number}){path.suffix}")
+            number += 1
+        return candidate
 
 def create_test_files(test_dir):
     """Create test files to organize"""
@@ -9,33 +9,1259 @@ Everything is in one giant function with no separation of concerns.
 Practice Challenge: Use the "Refactoring" prompt pattern to clean this up
 """
 
+import bisect
+import csv
+import heapq
+import itertools
 import json
 import os
+import re
+import sqlite3
+import stat
+import sys
+import tempfile
+import unicodedata
+from collections import Counter, namedtuple
 from datetime import datetime
 
+
+class DuplicateContactError(ValueError):
+    """Raised when adding a contact whose name is already in the store"""
+
+
+def name_key(name):
+    """Key used for the unique name index (case-insensitive, Unicode aware)"""
+    return name.strip().casefold()
+
+
+def normalize_email(email):
+    return email.strip().casefold()
+
+
+def normalize_phone(phone):
+    """Keep only digits (and a leading +) so '555-0100' and '(555) 0100' match"""
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    return '+' + digits if phone.startswith('+') else digits
+
+
+SEARCH_FIELDS = ('name', 'phone', 'email', 'address')
+SEARCH_MODES = ('substring', 'prefix', 'fuzzy')
+
+# Word padding so trigrams also mark where words start and end
+_WORD_START = '\x02'
+_WORD_END = '\x03'
+
+SearchPage = namedtuple('SearchPage', ['contacts', 'total', 'offset'])
+
+# Orders ContactStore.page can list contacts in
+SORT_ORDERS = ('added', 'name', 'email', 'created', 'updated')
+PAGE_SIZE = 50
+
+# A page of contacts and the cursor to pass back for the next one (None at the end)
+ContactPage = namedtuple('ContactPage', ['contacts', 'cursor'])
+
+
+def normalize_text(text):
+    """Case-fold, strip accents and collapse whitespace ('  José ' -> 'jose')"""
+    if text.isascii():
+        return ' '.join(text.lower().split())
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+_WORD = re.compile(r'\w+')
+
+
+def _tokens(text):
+    return _WORD.findall(text)
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _at_word_start(text, term):
+    """True if term occurs in text at the start of a word"""
+    position = text.find(term)
+    while position != -1:
+        if position == 0 or not text[position - 1].isalnum():
+            return True
+        position = text.find(term, position + 1)
+    return False
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance of a and b, or limit + 1 as soon as it must exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ch in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ch != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class SearchIndex:
+    """Trigram inverted index over the searchable fields of contacts
+
+    Each word of a contact's normalized fields is padded and split into
+    trigrams, and every trigram maps to the ids of the contacts containing
+    it. A query only verifies the contacts that share all of its trigrams
+    (substring, prefix) or enough of them to be within the edit distance
+    (fuzzy), instead of scanning every contact.
+    """
+
+    def __init__(self):
+        self._postings = {}  # trigram -> set of doc ids
+        self._docs = {}      # doc id -> (name key, normalized fields, words)
+        self._ids = {}       # name key -> doc id
+        self._next_id = 0
+        self._queued = []    # (name key, contact) pairs from add_many, not indexed yet
+
+    def __len__(self):
+        self._index_queued()
+        return len(self._docs)
+
+    def add(self, key, contact):
+        self._index_queued()
+        doc_id, words = self._add_doc(key, contact)
+        for gram in self._doc_grams(words):
+            postings = self._postings.get(gram)
+            if postings is None:
+                self._postings[gram] = postings = set()
+            postings.add(doc_id)
+
+    def add_many(self, items):
+        """
+        Queue (name key, contact) pairs to be indexed together on the next read
+        
+        A bulk import then only pays for indexing once, when it is first
+        searched, and the whole queue is indexed in one pass (see
+        _index_queued).
+        """
+        self._queued.extend(items)
+
+    def _index_queued(self):
+        """
+        Index the queued contacts in one pass
+        
+        Doc ids are grouped by word first, so each distinct word is split
+        into trigrams once and each posting set is extended once per pass,
+        instead of once per contact.
+        """
+        if not self._queued:
+            return
+        items, self._queued = self._queued, []
+        word_docs = {}
+        for key, contact in items:
+            doc_id, words = self._add_doc(key, contact)
+            for word in words:
+                docs = word_docs.get(word)
+                if docs is None:
+                    word_docs[word] = [doc_id]
+                else:
+                    docs.append(doc_id)
+        postings = self._postings
+        for word, docs in word_docs.items():
+            for gram in _trigrams(_WORD_START + word + _WORD_END):
+                existing = postings.get(gram)
+                if existing is None:
+                    postings[gram] = set(docs)
+                else:
+                    existing.update(docs)
+
+    def _add_doc(self, key, contact):
+        """Store a contact's normalized fields under a new doc id, returning it and the words"""
+        if key in self._ids:
+            self.remove(key)
+        fields = tuple(normalize_phone(contact.get(field) or '') if field == 'phone'
+                       else normalize_text(contact.get(field) or '')
+                       for field in SEARCH_FIELDS)
+        words = set()
+        for text in fields:
+            words.update(_tokens(text))
+        doc_id = self._next_id
+        self._next_id += 1
+        self._ids[key] = doc_id
+        self._docs[doc_id] = (key, fields, words)
+        return doc_id, words
+
+    def remove(self, key):
+        self._index_queued()
+        doc_id = self._ids.pop(key, None)
+        if doc_id is None:
+            return
+        _, _, words = self._docs.pop(doc_id)
+        for gram in self._doc_grams(words):
+            postings = self._postings[gram]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[gram]
+
+    def clear(self):
+        self._queued.clear()
+        self._postings.clear()
+        self._docs.clear()
+        self._ids.clear()
+
+    def search(self, term, mode='substring', max_edits=None, limit=None):
+        """
+        Find matching contacts, best first
+        
+        Args:
+            term: Text to look for (normalized like the indexed fields)
+            mode: 'substring', 'prefix' (a word starts with term) or 'fuzzy'
+                  (every word of term is within max_edits of a contact's word)
+            max_edits: Fuzzy tolerance; defaults to 1, or 2 for words over 5 characters
+            limit: Only rank this many of the best matches (None ranks them all)
+            
+        Returns:
+            (name keys of the best matches in rank order, total number of matches)
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+        self._index_queued()
+        if mode == 'fuzzy':
+            ranked = self._fuzzy(normalize_text(term), max_edits)
+        else:
+            ranked = {}
+            for variant in self._variants(term):
+                for doc_id, score in self._match(variant, mode == 'prefix'):
+                    if score < ranked.get(doc_id, score + 1):
+                        ranked[doc_id] = score
+        docs = self._docs
+        scored = ((score, docs[doc_id][0]) for doc_id, score in ranked.items())
+        order = sorted(scored) if limit is None else heapq.nsmallest(limit, scored)
+        return [key for _, key in order], len(ranked)
+
+    @staticmethod
+    def _doc_grams(words):
+        grams = set()
+        for word in words:
+            grams |= _trigrams(_WORD_START + word + _WORD_END)
+        return grams
+
+    @staticmethod
+    def _variants(term):
+        """Normalized forms of a query; phone-like terms are also tried as bare digits"""
+        variants = [normalize_text(term)]
+        if re.fullmatch(r'[\d\s().+-]+', term) and any(ch.isdigit() for ch in term):
+            digits = normalize_phone(term)
+            if digits not in variants:
+                variants.append(digits)
+        return variants
+
+    def _with_gram(self, fragment):
+        """Docs with a word containing fragment (shorter than a trigram, so scan the vocabulary)"""
+        docs = set()
+        for gram, postings in self._postings.items():
+            if fragment in gram:
+                docs |= postings
+        return docs
+
+    def _candidates(self, fragments):
+        """Doc ids containing every fragment (trigram or shorter) in some word"""
+        sets = []
+        for fragment in fragments:
+            postings = self._postings.get(fragment) if len(fragment) == 3 else \
+                self._with_gram(fragment)
+            if not postings:
+                return set()
+            sets.append(postings)
+        if not sets:
+            return set(self._docs)
+        sets.sort(key=len)
+        candidates = set(sets[0])
+        for postings in sets[1:]:
+            candidates &= postings
+            if not candidates:
+                break
+        return candidates
+
+    def _match(self, term, prefix):
+        """Yield (doc id, rank) for docs containing term (at a word start if prefix)"""
+        tokens = _tokens(term)
+        fragments = set()
+        for position, token in enumerate(tokens):
+            if prefix and position == 0:
+                token = _WORD_START + token
+            fragments |= _trigrams(token) if len(token) >= 3 else {token}
+        for doc_id in self._candidates(fragments):
+            _, fields, _ = self._docs[doc_id]
+            name = fields[0]
+            if name == term:
+                yield doc_id, 0
+            elif name.startswith(term):
+                yield doc_id, 1
+            elif _at_word_start(name, term):
+                yield doc_id, 2
+            elif not prefix and term in name:
+                yield doc_id, 3
+            elif any(_at_word_start(text, term) for text in fields[1:]):
+                yield doc_id, 4
+            elif not prefix and any(term in text for text in fields[1:]):
+                yield doc_id, 5
+
+    def _fuzzy(self, term, max_edits):
+        """Map doc id -> total edit distance for docs matching every word of term"""
+        tokens = _tokens(term)
+        if not tokens:
+            return {}
+        limits = [max_edits if max_edits is not None else (1 if len(t) <= 5 else 2)
+                  for t in tokens]
+        # A word within k edits shares at least len(grams) - 3k of its trigrams
+        # with the query word, so only docs reaching that count are checked
+        token, limit = max(zip(tokens, limits), key=lambda pair: len(pair[0]))
+        grams = _trigrams(_WORD_START + token + _WORD_END)
+        needed = len(grams) - 3 * limit
+        if needed > 0:
+            counts = Counter()
+            for gram in grams:
+                counts.update(self._postings.get(gram, ()))
+            candidates = [doc_id for doc_id, count in counts.items() if count >= needed]
+        else:
+            # Too short for the bound to rule anything out ('el' is one edit
+            # from 'al' with no trigram in common), so every doc is checked
+            candidates = self._docs
+
+        ranked = {}
+        # Contacts share most of their words, so distances are memoized per query
+        distances = {}
+        for doc_id in candidates:
+            _, _, words = self._docs[doc_id]
+            total = 0
+            for query_word, query_limit in zip(tokens, limits):
+                best = query_limit + 1
+                for word in words:
+                    distance = distances.get((query_word, word))
+                    if distance is None:
+                        distance = edit_distance(query_word, word, query_limit)
+                        distances[query_word, word] = distance
+                    if distance < best:
+                        best = distance
+                        if not best:
+                            break
+                if best > query_limit:
+                    break
+                total += best
+            else:
+                ranked[doc_id] = total
+        return ranked
+
+
+class SortedIndex:
+    """Sorted list of (sort value, name key) entries for cursor paging
+
+    Changes are queued and applied when the index is next read: a few at a
+    time by binary search, or by one merge-sort when many have piled up (a
+    bulk import), so neither reads nor writes pay for a full re-sort.
+    """
+
+    MERGE_THRESHOLD = 64
+
+    def __init__(self, entries=()):
+        self._entries = sorted(entries)
+        # Entry -> True (add) or False (remove); the last change wins
+        self._pending = {}
+
+    def __len__(self):
+        self._apply_pending()
+        return len(self._entries)
+
+    def add(self, entry):
+        self._pending[entry] = True
+
+    def remove(self, entry):
+        self._pending[entry] = False
+
+    def after(self, cursor, limit):
+        """Up to limit entries following cursor (from the start when cursor is None)"""
+        self._apply_pending()
+        start = 0 if cursor is None else bisect.bisect_right(self._entries, cursor)
+        return self._entries[start:start + limit]
+
+    def _apply_pending(self):
+        pending = self._pending
+        if not pending:
+            return
+        entries = self._entries
+        if len(pending) <= self.MERGE_THRESHOLD:
+            for entry, present in pending.items():
+                i = bisect.bisect_left(entries, entry)
+                found = i < len(entries) and entries[i] == entry
+                if present and not found:
+                    entries.insert(i, entry)
+                elif found and not present:
+                    del entries[i]
+        else:
+            entries = [entry for entry in entries if entry not in pending]
+            entries.extend(entry for entry, present in pending.items() if present)
+            # Timsort merges the sorted prefix with the appended run
+            entries.sort()
+            self._entries = entries
+        pending.clear()
+
+
+class ContactStore:
+    """Contacts indexed by name (unique), email and phone
+
+    Contacts stay plain dicts so they can be saved as JSON. They are kept in
+    a dict keyed by the case-folded name, which preserves insertion order
+    for listing and makes add, delete and name lookup O(1). Email and phone
+    indexes map normalized values to the names that use them, and a
+    SearchIndex serves search. The 'added' order pages straight from an
+    append-only log of insertions; the other sorted views for paging (see
+    page) are built on first use and kept up to date afterwards. With a
+    journal (see STORAGE_BACKENDS) every add, update and delete is also
+    recorded there as it happens.
+    """
+
+    def __init__(self, contacts=None, journal=None):
+        self.journal = journal
+        self._contacts = {}
+        self._by_email = {}
+        self._by_phone = {}
+        self._search_index = SearchIndex()
+        # Name key -> insertion sequence number, plus the (sequence, key)
+        # log in insertion order; entries whose sequence is stale are dead
+        self._added_at = {}
+        self._added_log = []
+        self._sequence = itertools.count()
+        self._views = {}
+        if contacts:
+            self.load(contacts)
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def __iter__(self):
+        return iter(self._contacts.values())
+
+    def __contains__(self, name):
+        return name_key(name) in self._contacts
+
+    def load(self, contacts):
+        """Add saved contacts, returning the ones skipped because their name was taken"""
+        skipped = []
+        indexed = []
+        for contact in contacts:
+            if name_key(contact['name']) in self._contacts:
+                skipped.append(contact)
+            else:
+                indexed.append((self._insert(contact, search=False), contact))
+        self._search_index.add_many(indexed)
+        return skipped
+
+    def add(self, contact):
+        """Add a contact dict, raising DuplicateContactError if the name exists"""
+        if name_key(contact['name']) in self._contacts:
+            raise DuplicateContactError(f"Contact '{contact['name']}' already exists")
+        self._insert(contact)
+        if self.journal is not None:
+            self.journal.record('add', contact['name'], contact)
+        return contact
+
+    def add_many(self, contacts):
+        """Add contacts with a single journal write, returning the ones skipped as duplicates"""
+        added = []
+        indexed = []
+        skipped = []
+        for contact in contacts:
+            if name_key(contact['name']) in self._contacts:
+                skipped.append(contact)
+            else:
+                indexed.append((self._insert(contact, search=False), contact))
+                added.append(contact)
+        # Indexed for search in one pass when next searched
+        self._search_index.add_many(indexed)
+        if added and self.journal is not None:
+            self.journal.record_many([('add', contact['name'], contact) for contact in added])
+        return skipped
+
+    def get(self, name):
+        return self._contacts.get(name_key(name))
+
+    def delete(self, name):
+        """Remove a contact by name, returning it (or None if not found)"""
+        contact = self._remove(name)
+        if contact is not None and self.journal is not None:
+            self.journal.record('delete', contact['name'])
+        return contact
+
+    def update(self, name, /, **fields):
+        """Change fields of a contact (renaming keeps the unique constraint)"""
+        contact = self.get(name)
+        if contact is None:
+            raise KeyError(name)
+        new_name = fields.get('name', contact['name'])
+        if name_key(new_name) != name_key(contact['name']) and new_name in self:
+            raise DuplicateContactError(f"Contact '{new_name}' already exists")
+        old_name = contact['name']
+        self._remove(old_name)
+        contact.update(fields)
+        contact['updated'] = datetime.now().isoformat()
+        self._insert(contact)
+        if self.journal is not None:
+            self.journal.record('update', old_name, contact)
+        return contact
+
+    def replay(self, op, name, contact=None):
+        """
+        Apply a journaled change without journaling it again
+        
+        Records hold whole contacts, so replay is a blind delete and/or
+        set. Replaying changes that a snapshot already contains leaves the
+        store as it was, which keeps recovery safe after an interrupted
+        compaction.
+        """
+        if op in ('update', 'delete'):
+            self._remove(name)
+        if op in ('add', 'update'):
+            self._remove(contact['name'])
+            self._insert(contact)
+
+    def find_by_email(self, email):
+        names = self._by_email.get(normalize_email(email), ())
+        return [self._contacts[key] for key in names]
+
+    def find_by_phone(self, phone):
+        names = self._by_phone.get(normalize_phone(phone), ())
+        return [self._contacts[key] for key in names]
+
+    def search(self, term, mode='substring', offset=0, limit=None, max_edits=None):
+        """
+        Find contacts by name, phone, email or address, best matches first
+        
+        Name matches rank above other fields, and exact and word-start
+        matches above other substrings (fuzzy results rank by edit distance).
+        
+        Args:
+            term: Text to search for (case and accent insensitive)
+            mode: 'substring', 'prefix' or 'fuzzy' (see SearchIndex.search)
+            offset: Number of results to skip
+            limit: Page size (None returns every result from offset)
+            max_edits: Fuzzy tolerance
+            
+        Returns:
+            SearchPage of the contacts on the page, the total and the offset
+        """
+        end = None if limit is None else offset + limit
+        keys, total = self._search_index.search(term, mode, max_edits, end)
+        page = [self._contacts[key] for key in keys[offset:]]
+        return SearchPage(page, total, offset)
+
+    def iter_search_pages(self, term, mode='substring', offset=0, limit=PAGE_SIZE,
+                          max_edits=None):
+        """
+        Lazily yield lists of matching contacts, one page at a time
+        
+        Every match is ranked once, when the first page is needed, and the
+        pages are slices of that ranking (calling search per page would
+        collect and rank all the matches again for each one).
+        """
+        keys, _ = self._search_index.search(term, mode, max_edits)
+        for start in range(offset, len(keys), limit):
+            page = [self._contacts[key] for key in keys[start:start + limit]
+                    if key in self._contacts]
+            if page:
+                yield page
+
+    def to_list(self):
+        return list(self._contacts.values())
+
+    def page(self, order='added', cursor=None, limit=PAGE_SIZE):
+        """
+        One page of contacts in a sorted order, found by binary search
+        
+        The cost is O(log n + limit) however deep the page is, and the
+        'added' order needs no sorting at all. Cursors stay valid across
+        edits: the next page starts after the last contact shown, wherever
+        it now sits.
+        
+        Args:
+            order: One of SORT_ORDERS ('added' is the list command's order)
+            cursor: The cursor of the previous page (None for the first page)
+            limit: Page size
+            
+        Returns:
+            ContactPage of the contacts and the next page's cursor
+        """
+        if order == 'added':
+            entries = self._added_after(cursor, limit)
+        else:
+            view = self._views.get(order)
+            if view is None:
+                if order not in SORT_ORDERS:
+                    raise ValueError(f"Unknown order '{order}', expected one of {SORT_ORDERS}")
+                view = SortedIndex(self._sort_entry(order, key, contact)
+                                   for key, contact in self._contacts.items())
+                self._views[order] = view
+            entries = view.after(cursor, limit)
+        contacts = [self._contacts[key] for _, key in entries]
+        next_cursor = entries[-1] if len(entries) == limit else None
+        return ContactPage(contacts, next_cursor)
+
+    def iter_pages(self, order='added', limit=PAGE_SIZE):
+        """Lazily yield lists of contacts, one page at a time"""
+        cursor = None
+        while True:
+            contacts, cursor = self.page(order, cursor, limit)
+            if contacts:
+                yield contacts
+            if cursor is None:
+                return
+
+    def _added_after(self, cursor, limit):
+        """Up to limit live (sequence, key) entries of the insertion log after cursor"""
+        log = self._added_log
+        added_at = self._added_at
+        # Sequence numbers only grow, so the log is already sorted
+        i = 0 if cursor is None else bisect.bisect_right(log, tuple(cursor))
+        entries = []
+        while i < len(log) and len(entries) < limit:
+            sequence, key = log[i]
+            if added_at.get(key) == sequence:
+                entries.append(log[i])
+            i += 1
+        return entries
+
+    def _sort_entry(self, order, key, contact):
+        if order == 'name':
+            return (key, key)
+        if order == 'email':
+            return (normalize_email(contact.get('email') or ''), key)
+        return (contact.get(order) or '', key)
+
+    def _index_entries(self, contact):
+        """(index, normalized value) pairs for a contact's email and phone"""
+        if contact.get('email'):
+            yield self._by_email, normalize_email(contact['email'])
+        if contact.get('phone'):
+            yield self._by_phone, normalize_phone(contact['phone'])
+
+    def _insert(self, contact, search=True):
+        """Index a contact, returning its name key (search=False leaves the search index to the caller)"""
+        key = name_key(contact['name'])
+        self._contacts[key] = contact
+        sequence = next(self._sequence)
+        self._added_at[key] = sequence
+        self._added_log.append((sequence, key))
+        if search:
+            self._search_index.add(key, contact)
+        for order, view in self._views.items():
+            view.add(self._sort_entry(order, key, contact))
+        # Index values are dicts used as ordered sets of name keys
+        for index, value in self._index_entries(contact):
+            index.setdefault(value, {})[key] = None
+        return key
+
+    def _remove(self, name):
+        contact = self._contacts.pop(name_key(name), None)
+        if contact is not None:
+            self._unindex(contact)
+        return contact
+
+    def _unindex(self, contact):
+        key = name_key(contact['name'])
+        for order, view in self._views.items():
+            view.remove(self._sort_entry(order, key, contact))
+        del self._added_at[key]
+        # Drop dead log entries once they outnumber the live ones
+        if len(self._added_log) > 2 * len(self._added_at) + 64:
+            added_at = self._added_at
+            self._added_log = [(sequence, key) for sequence, key in self._added_log
+                               if added_at.get(key) == sequence]
+        self._search_index.remove(key)
+        for index, value in self._index_entries(contact):
+            names = index.get(value)
+            if names is not None:
+                names.pop(key, None)
+                if not names:
+                    del index[value]
+
+
+def _file_mode(path):
+    """Permission bits for path: the existing file's, or what the umask gives a new file"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+class JournalBackend:
+    """Snapshot plus append-only journal, so an edit costs one small append
+
+    The snapshot is the usual JSON list of contacts. Each add, update and
+    delete is appended to <snapshot>.journal as one JSON line and flushed
+    (and fsynced unless fsync=False) before the call returns. Startup loads
+    the snapshot and replays the journal; a torn last line left by a crash
+    is dropped. Once the journal holds compact_every edits and at least one
+    per contact, and on compact() or close(), the store is written to a new
+    snapshot that atomically replaces the old one and the journal is emptied.
+    """
+
+    def __init__(self, path='contacts.json', compact_every=10_000, fsync=True):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.store = None
+        self._journal = None
+        self._pending = 0
+
+    def load(self):
+        """Build the store from the snapshot and journal; it then records into this backend"""
+        store = ContactStore()
+        skipped = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                skipped = store.load(json.load(f))
+        if skipped:
+            print(f"Skipped {len(skipped)} contacts with duplicate names")
+        self._pending = self._replay(store)
+        store.journal = self
+        self.store = store
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        return store
+
+    def record(self, op, name, contact=None):
+        self.record_many([(op, name, contact)])
+
+    def record_many(self, changes, compact=True):
+        """
+        Append (op, name, contact) changes with one write and one fsync
+        
+        compact=False is for callers that apply the changes to the store
+        after journaling them: compacting first would snapshot the store
+        without them and then empty the journal that holds them. Such
+        callers call compact_if_due() once the store has the changes.
+        """
+        lines = []
+        for op, name, contact in changes:
+            record = {'op': op, 'name': name}
+            if contact is not None:
+                record['contact'] = contact
+            lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+        self._journal.write(''.join(lines))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._pending += len(lines)
+        if compact:
+            self.compact_if_due()
+
+    def compact_if_due(self):
+        """Compact once enough edits have been journaled"""
+        # Waiting for as many edits as there are contacts keeps the cost of
+        # rewriting the snapshot amortized O(1) per edit
+        if self._pending >= max(self.compact_every, len(self.store)):
+            self.compact()
+
+    def compact(self):
+        """Write the store as a new snapshot and empty the journal"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        mode = _file_mode(self.path)
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False, suffix='.tmp',
+                                         encoding='utf-8') as temp:
+            try:
+                # One contact per line: still a JSON list, but written as a stream
+                temp.write('[')
+                for i, contact in enumerate(self.store):
+                    temp.write(',\n' if i else '\n')
+                    temp.write(json.dumps(contact, ensure_ascii=False))
+                temp.write('\n]\n')
+                temp.flush()
+                # NamedTemporaryFile creates the file 0600
+                os.chmod(temp.name, mode)
+                os.fsync(temp.fileno())
+            except BaseException:
+                temp.close()
+                os.unlink(temp.name)
+                raise
+        try:
+            os.replace(temp.name, self.path)
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+        # Replaying the old journal over the new snapshot is harmless, so a
+        # crash before the truncate below loses nothing
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self._journal is None:
+            return
+        if self._pending:
+            self.compact()
+        self._journal.close()
+        self._journal = None
+
+    def _replay(self, store):
+        """Apply the journal to store, truncating a torn final record"""
+        if not os.path.exists(self.journal_path):
+            return 0
+        replayed = 0
+        good_end = 0
+        with open(self.journal_path, 'rb') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+                except ValueError:
+                    if f.read(1):
+                        raise ValueError(f"{self.journal_path} line {number} is corrupt")
+                    print(f"Dropped an incomplete record at the end of {self.journal_path}")
+                    break
+                store.replay(record['op'], record['name'], record.get('contact'))
+                replayed += 1
+                good_end += len(line)
+        if good_end != os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_end)
+        return replayed
+
+
+class SQLiteBackend:
+    """Contacts in an SQLite table (WAL mode), one committed row write per edit
+
+    Nothing needs compacting: SQLite applies each change in place and
+    recovers its own log after a crash.
+    """
+
+    def __init__(self, path='contacts.db'):
+        self.path = path
+        self.store = None
+        self._db = None
+
+    def load(self):
+        # Writes may come from a writer thread (see contact_service), one at a time
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS contacts "
+                         "(key TEXT PRIMARY KEY, contact TEXT NOT NULL)")
+        store = ContactStore()
+        for (contact,) in self._db.execute("SELECT contact FROM contacts ORDER BY rowid"):
+            store.replay('add', None, json.loads(contact))
+        store.journal = self
+        self.store = store
+        return store
+
+    def record(self, op, name, contact=None):
+        self.record_many([(op, name, contact)])
+
+    def record_many(self, changes, compact=True):
+        """Apply (op, name, contact) changes in one transaction (compact is ignored)"""
+        with self._db:
+            for op, name, contact in changes:
+                if op in ('update', 'delete'):
+                    self._db.execute("DELETE FROM contacts WHERE key = ?", (name_key(name),))
+                if op in ('add', 'update'):
+                    self._db.execute("INSERT OR REPLACE INTO contacts (key, contact) VALUES (?, ?)",
+                                     (name_key(contact['name']),
+                                      json.dumps(contact, ensure_ascii=False)))
+
+    def compact(self):
+        """Fold SQLite's write-ahead log back into the database file"""
+        self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def compact_if_due(self):
+        """Nothing to do: SQLite checkpoints its write-ahead log itself"""
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+STORAGE_BACKENDS = {
+    'journal': JournalBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+CONTACT_FIELDS = ('name', 'phone', 'email', 'address', 'created', 'updated')
+IMPORT_CHUNK_SIZE = 10_000
+
+# File extension -> import/export format
+FILE_FORMATS = {
+    '.csv': 'csv',
+    '.vcf': 'vcard',
+    '.vcard': 'vcard',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+
+def _timestamp(raw, field, now):
+    """An imported created/updated value as an ISO 8601 string (now when it is missing)"""
+    value = raw.get(field)
+    if value is None or value == '':
+        return now
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid {field} timestamp: {value!r} (expected an ISO 8601 string)")
+    try:
+        return datetime.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid {field} timestamp: {value!r} (expected an ISO 8601 string)")
+
+
+def validate_contact(raw, now):
+    """
+    Check and normalize one imported record into a contact dict
+    
+    Raises:
+        ValueError: The record has no name, an invalid email or a created or
+            updated value that is not an ISO 8601 timestamp
+    """
+    name = ' '.join(str(raw.get('name') or '').split())
+    if not name:
+        raise ValueError("Name cannot be empty")
+    email = str(raw.get('email') or '').strip()
+    if email and '@' not in email:
+        raise ValueError(f"Invalid email format: {email!r}")
+    return {
+        'name': name,
+        'phone': str(raw.get('phone') or '').strip(),
+        'email': email,
+        'address': ' '.join(str(raw.get('address') or '').split()),
+        'created': _timestamp(raw, 'created', now),
+        'updated': _timestamp(raw, 'updated', now),
+    }
+
+
+def _read_csv(f):
+    """Yield (line number, record) from a CSV file with a header row (columns in any case)"""
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [(i, column.strip().lower()) for i, column in enumerate(header)
+               if column.strip().lower() in CONTACT_FIELDS]
+    for row in reader:
+        if row:
+            yield reader.line_num, {field: row[i] for i, field in columns if i < len(row)}
+
+
+def _read_jsonl(f):
+    """Yield (line number, record or ValueError) from a JSON Lines file"""
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            record = ValueError("Expected a JSON object")
+        yield number, record
+
+
+def _vcard_unescape(value):
+    return re.sub(r'\\([\\,;nN])', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def _unfold(f):
+    """Yield (line number, logical line) from a vCard file, joining folded continuation lines"""
+    current = None
+    for number, line in enumerate(f, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current = (current[0], current[1] + line[1:])
+            continue
+        if current is not None:
+            yield current
+        current = (number, line)
+    if current is not None:
+        yield current
+
+
+# vCard properties read into single-valued contact fields (the first one wins)
+_VCARD_FIELDS = {'TEL': 'phone', 'EMAIL': 'email'}
+
+
+def _read_vcard(f):
+    """Yield (line number of BEGIN, record) for each vCard, using FN (or N), TEL, EMAIL and ADR"""
+    record = None
+    start = 0
+    for number, line in _unfold(f):
+        name, _, value = line.partition(':')
+        # Drop parameters (TEL;TYPE=CELL) and group prefixes (item1.EMAIL)
+        prop = name.split(';', 1)[0].split('.')[-1].upper()
+        if prop == 'BEGIN' and value.upper() == 'VCARD':
+            record, start = {}, number
+        elif record is None:
+            continue
+        elif prop == 'END':
+            yield start, record
+            record = None
+        elif prop == 'FN':
+            record['name'] = _vcard_unescape(value)
+        elif prop == 'N' and 'name' not in record:
+            family, given = (value.split(';') + [''])[:2]
+            record['name'] = ' '.join(_vcard_unescape(part) for part in (given, family) if part)
+        elif prop in _VCARD_FIELDS:
+            record.setdefault(_VCARD_FIELDS[prop], _vcard_unescape(value))
+        elif prop == 'ADR' and 'address' not in record:
+            parts = [_vcard_unescape(part).strip() for part in value.split(';')]
+            record['address'] = ', '.join(part for part in parts if part)
+        elif prop == 'REV':
+            record['updated'] = value
+
+
+IMPORT_READERS = {
+    'csv': _read_csv,
+    'vcard': _read_vcard,
+    'jsonl': _read_jsonl,
+}
+
+
+def _vcard_escape(value):
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;').replace('\n', '\\n')
+
+
+def _write_csv(f, contacts):
+    writer = csv.writer(f)
+    writer.writerow(CONTACT_FIELDS)
+    count = 0
+    for batch in _batches(contacts, IMPORT_CHUNK_SIZE):
+        writer.writerows([contact.get(field, '') for field in CONTACT_FIELDS]
+                         for contact in batch)
+        count += len(batch)
+    return count
+
+
+def _write_jsonl(f, contacts):
+    count = 0
+    for batch in _batches(contacts, IMPORT_CHUNK_SIZE):
+        f.write(''.join(json.dumps(contact, ensure_ascii=False) + '\n' for contact in batch))
+        count += len(batch)
+    return count
+
+
+def _write_vcard(f, contacts):
+    count = 0
+    for batch in _batches(contacts, IMPORT_CHUNK_SIZE):
+        cards = []
+        for contact in batch:
+            lines = ['BEGIN:VCARD', 'VERSION:3.0', f"FN:{_vcard_escape(contact['name'])}",
+                     f"N:;{_vcard_escape(contact['name'])};;;"]
+            if contact.get('phone'):
+                lines.append(f"TEL:{_vcard_escape(contact['phone'])}")
+            if contact.get('email'):
+                lines.append(f"EMAIL:{_vcard_escape(contact['email'])}")
+            if contact.get('address'):
+                lines.append(f"ADR:;;{_vcard_escape(contact['address'])};;;;")
+            if contact.get('updated'):
+                lines.append(f"REV:{contact['updated']}")
+            lines.append('END:VCARD')
+            cards.append('\r\n'.join(lines) + '\r\n')
+        f.write(''.join(cards))
+        count += len(batch)
+    return count
+
+
+EXPORT_WRITERS = {
+    'csv': _write_csv,
+    'vcard': _write_vcard,
+    'jsonl': _write_jsonl,
+}
+
+
+def _batches(items, size):
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _file_format(path, fmt):
+    if fmt is None:
+        fmt = FILE_FORMATS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise ValueError(f"Cannot tell the format of {path}, expected one of "
+                             f"{sorted(FILE_FORMATS)} or an explicit format")
+    if fmt not in IMPORT_READERS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {sorted(IMPORT_READERS)}")
+    return fmt
+
+
+class ImportReport:
+    """Counts from import_contacts and the first max_errors problems as (row, message)"""
+
+    def __init__(self, max_errors):
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def error(self, row, message):
+        if len(self.errors) < self.max_errors:
+            self.errors.append((row, message))
+
+    def __repr__(self):
+        return (f"ImportReport(rows={self.rows}, imported={self.imported}, "
+                f"duplicates={self.duplicates}, invalid={self.invalid})")
+
+
+def import_contacts(store, path, fmt=None, chunk_size=IMPORT_CHUNK_SIZE, max_errors=1000):
+    """
+    Stream contacts from a CSV, vCard or JSON Lines file into the store
+    
+    Records are read and validated chunk_size at a time, so memory stays
+    bounded however large the file is. Each valid chunk is added with one
+    add_many call (one journal write). Invalid rows and names already in
+    the store or earlier in the file are counted and reported, and the
+    import carries on.
+    
+    Args:
+        store: ContactStore to add to
+        path: File to read ('csv', 'vcard' or 'jsonl', picked by extension)
+        fmt: Format override
+        chunk_size: Records validated and added per batch
+        max_errors: How many problems to keep in the report (all are counted)
+        
+    Returns:
+        ImportReport
+    """
+    reader = IMPORT_READERS[_file_format(path, fmt)]
+    report = ImportReport(max_errors)
+    now = datetime.now().isoformat()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for chunk in _batches(reader(f), chunk_size):
+            valid = []
+            rows = []
+            for row, record in chunk:
+                report.rows += 1
+                try:
+                    if isinstance(record, ValueError):
+                        raise record
+                    valid.append(validate_contact(record, now))
+                    rows.append(row)
+                except ValueError as e:
+                    report.invalid += 1
+                    report.error(row, str(e))
+            skipped = {id(contact) for contact in store.add_many(valid)}
+            for row, contact in zip(rows, valid):
+                if id(contact) in skipped:
+                    report.duplicates += 1
+                    report.error(row, f"Contact '{contact['name']}' already exists")
+            report.imported += len(valid) - len(skipped)
+    return report
+
+
+def export_contacts(contacts, path, fmt=None):
+    """
+    Stream contacts to a CSV, vCard or JSON Lines file ('-' writes to stdout)
+    
+    Contacts are formatted in batches and written with one call per batch.
+    
+    Args:
+        contacts: Any iterable of contacts (a ContactStore, search results...)
+        path: File to write
+        fmt: Format override (required for '-')
+        
+    Returns:
+        Number of contacts written
+    """
+    writer = EXPORT_WRITERS[_file_format(path, fmt)]
+    if path == '-':
+        return writer(sys.stdout, contacts)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        return writer(f, contacts)
+
+
+def render_contacts(contacts, start=1):
+    """Format numbered contacts the way the list command shows them, as one string"""
+    lines = []
+    for i, contact in enumerate(contacts, start):
+        lines.append(f"{i}. {contact['name']}")
+        if contact['phone']:
+            lines.append(f"   Phone: {contact['phone']}")
+        if contact['email']:
+            lines.append(f"   Email: {contact['email']}")
+        if contact['address']:
+            lines.append(f"   Address: {contact['address']}")
+        lines.append(f"   Created: {contact['created'][:10]}")
+        lines.append("")
+    return '\n'.join(lines) + '\n'
+
+
+def render_search_results(contacts, start=1):
+    """Format contacts the way the search command shows them, as one string"""
+    return ''.join(f"Name: {contact['name']}\nPhone: {contact['phone']}\n"
+                   f"Email: {contact['email']}\n\n" for contact in contacts)
+
+
+def write_pages(pages, render, out=None, interactive=None):
+    """
+    Write pages of contacts with one write per page
+    
+    On a terminal the output pauses after each page. Written to a file or
+    pipe, every page is streamed without pausing.
+    
+    Args:
+        pages: Iterable of contact lists (fetched lazily, e.g. iter_pages)
+        render: render_contacts or render_search_results
+        out: Stream to write to (default stdout)
+        interactive: Pause between pages (default: when out and stdin are terminals)
+        
+    Returns:
+        Number of contacts written
+    """
+    if out is None:
+        out = sys.stdout
+    if interactive is None:
+        interactive = out.isatty() and sys.stdin.isatty()
+    shown = 0
+    for page in pages:
+        if shown and interactive:
+            if input("-- More: Enter to continue, q to stop -- ").strip().lower() == 'q':
+                break
+        out.write(render(page, shown + 1))
+        out.flush()
+        shown += len(page)
+    return shown
+
+
 def contact_manager():
     """One giant function that does EVERYTHING - needs refactoring!"""
     
     # Hardcoded filename - should be configurable
     contacts_file = "contacts.json"
     
-    # Load contacts - no error handling!
-    if os.path.exists(contacts_file):
-        with open(contacts_file, 'r') as f:
-            contacts = json.load(f)
-    else:
-        contacts = []
+    # Load the snapshot and replay edits journaled since - no error handling!
+    backend = JournalBackend(contacts_file)
+    contacts = backend.load()
     
     print("Contact Manager - Messy Version")
-    print("Commands: add, list, search, delete, save, quit")
+    print("Commands: add, list, search, delete, import, export, save, quit")
     
     while True:
         command = input("\nEnter command: ").strip().lower()
+        # 'list name' (or email, created, updated) picks a sort order
+        command, _, argument = command.partition(' ')
         
         if command == "quit":
-            # Save before quitting - should be automatic
-            with open(contacts_file, 'w') as f:
-                json.dump(contacts, f, indent=2)
+            # Edits are already journaled; fold them into the snapshot
+            backend.close()
             break
             
         elif command == "add":
@@ -57,15 +1283,10 @@ def contact_manager():
                 print("Invalid email format")
                 continue
             
-            # Check for duplicates - inefficient search
-            duplicate = False
-            for contact in contacts:
-                if contact['name'].lower() == name.lower():
-                    print("Contact already exists!")
-                    duplicate = True
-                    break
-            
-            if not duplicate:
+            # Check for duplicates with the name index
+            if name in contacts:
+                print("Contact already exists!")
+            else:
                 # Creating contact object - should be a class
                 new_contact = {
                     'name': name,
@@ -75,51 +1296,43 @@ def contact_manager():
                     'created': datetime.now().isoformat(),
                     'updated': datetime.now().isoformat()
                 }
-                contacts.append(new_contact)
+                contacts.add(new_contact)
                 print(f"Added {name} to contacts")
                 
         elif command == "list":
-            # List contacts - formatting should be separate
-            if not contacts:
+            # Pages are fetched from a sorted view as they are shown
+            order = argument or 'added'
+            if order not in SORT_ORDERS:
+                print(f"Unknown order, expected one of: {', '.join(SORT_ORDERS)}")
+            elif not contacts:
                 print("No contacts found")
             else:
                 print(f"\nFound {len(contacts)} contacts:")
                 print("-" * 50)
-                for i, contact in enumerate(contacts, 1):
-                    print(f"{i}. {contact['name']}")
-                    if contact['phone']:
-                        print(f"   Phone: {contact['phone']}")
-                    if contact['email']:
-                        print(f"   Email: {contact['email']}")
-                    if contact['address']:
-                        print(f"   Address: {contact['address']}")
-                    print(f"   Created: {contact['created'][:10]}")
-                    print()
+                write_pages(contacts.iter_pages(order), render_contacts)
                     
         elif command == "search":
-            # Search logic - should be its own function
+            # 'smi*' searches word prefixes and '~smyth' is a fuzzy search
             search_term = input("Search for: ").strip().lower()
+            mode = 'substring'
+            if search_term.endswith('*'):
+                mode, search_term = 'prefix', search_term.rstrip('*')
+            elif search_term.startswith('~'):
+                mode, search_term = 'fuzzy', search_term.lstrip('~')
             if not search_term:
                 print("Search term cannot be empty")
                 continue
                 
-            found = []
-            for contact in contacts:
-                # Inefficient search through all fields
-                if (search_term in contact['name'].lower() or 
-                    search_term in contact['phone'].lower() or 
-                    search_term in contact['email'].lower() or 
-                    search_term in contact['address'].lower()):
-                    found.append(contact)
+            found = contacts.search(search_term, mode, 0, PAGE_SIZE)
             
-            if found:
-                print(f"\nFound {len(found)} matching contacts:")
+            if found.total:
+                print(f"\nFound {found.total} matching contacts:")
                 print("-" * 40)
-                for contact in found:
-                    print(f"Name: {contact['name']}")
-                    print(f"Phone: {contact['phone']}")
-                    print(f"Email: {contact['email']}")
-                    print()
+                # The rest are only ranked (once) if the user asks for a second page
+                pages = itertools.chain(
+                    [found.contacts],
+                    contacts.iter_search_pages(search_term, mode, offset=PAGE_SIZE))
+                write_pages(pages, render_search_results)
             else:
                 print("No matching contacts found")
                 
@@ -130,23 +1343,38 @@ def contact_manager():
                 print("Name cannot be empty")
                 continue
                 
-            # Linear search again - inefficient
-            deleted = False
-            for i, contact in enumerate(contacts):
-                if contact['name'].lower() == name_to_delete.lower():
-                    contacts.pop(i)
-                    print(f"Deleted {contact['name']}")
-                    deleted = True
-                    break
-                    
-            if not deleted:
+            contact = contacts.delete(name_to_delete)
+            if contact is not None:
+                print(f"Deleted {contact['name']}")
+            else:
                 print("Contact not found")
                 
+        elif command == "import":
+            path = input("File to import (.csv, .vcf, .jsonl): ").strip()
+            try:
+                report = import_contacts(contacts, path)
+            except (OSError, ValueError) as e:
+                print(f"Error importing contacts: {e}")
+                continue
+            print(f"Imported {report.imported} of {report.rows} contacts "
+                  f"({report.duplicates} duplicates, {report.invalid} invalid)")
+            for row, message in report.errors[:10]:
+                print(f"   Row {row}: {message}")
+            if len(report.errors) > 10:
+                print(f"   ... and {report.duplicates + report.invalid - 10} more")
+                
+        elif command == "export":
+            path = input("File to export to (.csv, .vcf, .jsonl): ").strip()
+            try:
+                count = export_contacts(contacts, path)
+                print(f"Exported {count} contacts to {path}")
+            except (OSError, ValueError) as e:
+                print(f"Error exporting contacts: {e}")
+                
         elif command == "save":
-            # Manual save - should be automatic
+            # Edits are journaled as they happen; this compacts the journal
             try:
-                with open(contacts_file, 'w') as f:
-                    json.dump(contacts, f, indent=2)
+                backend.compact()
                 print("Contacts saved")
             except Exception as e:
                 print(f"Error saving contacts: {e}")
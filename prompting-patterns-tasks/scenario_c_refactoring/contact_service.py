@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""
+Contact Service
+===============
+
+Serves the contact store over a small asyncio HTTP/JSON API on localhost,
+plus a load generator to hammer it.
+
+    python contact_service.py serve --file contacts.json --port 8080
+    python contact_service.py load --port 8080 --clients 50 --requests 200
+    python contact_service.py load --local          # starts its own server
+
+Endpoints (responses are JSON and paginated; /contacts returns a
+next_cursor to pass back as cursor, /search takes offset and limit):
+
+    GET    /contacts?order=name&limit=50      list (orders: added, name, email, ...)
+    GET    /contacts/<name>                   one contact
+    GET    /search?q=smi&mode=prefix          ranked search (substring, prefix, fuzzy)
+    POST   /contacts                          add {"name": ..., "email": ...}
+    DELETE /contacts/<name>                   delete
+
+Reads run straight against the in-memory store and interleave freely.
+Writes are queued to a single writer task, which checks everything that
+is waiting as one batch, journals the batch with one write and only then
+applies it to the store and answers. A burst of clients can never
+interleave two writes to the file, and a write that fails to reach the
+journal never shows up in the store.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from contact_manager import (SEARCH_MODES, SORT_ORDERS, STORAGE_BACKENDS,
+                             DuplicateContactError, name_key, validate_contact)
+
+DEFAULT_PORT = 8080
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+MAX_BODY_SIZE = 1 << 20
+WRITE_BATCH_SIZE = 1000
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ContactService:
+    """Library API over a storage backend: concurrent reads, one batching writer
+
+    Call start() on the event loop before writing and close() when done.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.store = backend.load()
+        # Writes are journaled in batches by the writer task instead
+        self.store.journal = None
+        self._writes = None
+        self._writer = None
+        # Journal I/O runs here so the event loop keeps serving reads
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='contact-writer')
+
+    async def start(self):
+        self._writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        """Finish queued writes, then compact the journal and close the backend"""
+        if self._writer is not None:
+            await self._writes.put(None)
+            await self._writer
+            self._writer = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.close)
+        self._executor.shutdown()
+
+    def get(self, name):
+        return self.store.get(name)
+
+    def list(self, order='added', cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """(ContactPage, total number of contacts) for one page of a sorted view"""
+        return self.store.page(order, cursor, limit), len(self.store)
+
+    def search(self, term, mode='substring', offset=0, limit=DEFAULT_PAGE_SIZE):
+        return self.store.search(term, mode, offset, limit)
+
+    async def add(self, record):
+        """Validate and add a contact (raises ValueError or DuplicateContactError)"""
+        return await self._submit('add', record)
+
+    async def delete(self, name):
+        """Delete a contact by name, returning it (or None if not found)"""
+        return await self._submit('delete', name)
+
+    async def _submit(self, op, argument):
+        future = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait((op, argument, future))
+        return await future
+
+    def _plan(self, op, argument, batch_contacts):
+        """
+        Check one write against the store and the batch so far, without changing the store
+        
+        batch_contacts maps the name keys written earlier in the batch to
+        their contact (None once deleted). Returns the journal change (None
+        if there is nothing to change) and the result for the caller.
+        """
+        if op == 'add':
+            contact = validate_contact(argument, datetime.now().isoformat())
+            key = name_key(contact['name'])
+            existing = batch_contacts[key] if key in batch_contacts else self.store.get(key)
+            if existing is not None:
+                raise DuplicateContactError(f"Contact '{contact['name']}' already exists")
+            batch_contacts[key] = contact
+            return ('add', contact['name'], contact), contact
+        key = name_key(argument)
+        contact = batch_contacts[key] if key in batch_contacts else self.store.get(key)
+        if contact is None:
+            return None, None
+        batch_contacts[key] = None
+        return ('delete', contact['name'], None), contact
+
+    def _apply(self, changes):
+        for op, name, contact in changes:
+            if op == 'add':
+                self.store.add(contact)
+            else:
+                self.store.delete(name)
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self._writes.get()]
+            while not self._writes.empty() and len(batch) < WRITE_BATCH_SIZE:
+                batch.append(self._writes.get_nowait())
+
+            changes = []
+            outcomes = []  # (future, result, error, whether it changes the store)
+            batch_contacts = {}
+            for item in batch:
+                if item is None:
+                    stopping = True
+                    continue
+                op, argument, future = item
+                try:
+                    change, result = self._plan(op, argument, batch_contacts)
+                except Exception as e:
+                    outcomes.append((future, None, e, False))
+                    continue
+                if change is not None:
+                    changes.append(change)
+                outcomes.append((future, result, None, change is not None))
+
+            # Nothing reaches the store (or readers) before its batch is on
+            # disk, and compaction waits until the store holds the batch
+            if changes:
+                try:
+                    await loop.run_in_executor(self._executor, self.backend.record_many,
+                                               changes, False)
+                    self._apply(changes)
+                except Exception as e:
+                    outcomes = [(future, None, e, True) if changed
+                                else (future, result, error, changed)
+                                for future, result, error, changed in outcomes]
+            for future, result, error, _ in outcomes:
+                if future.cancelled():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            if changes:
+                try:
+                    await loop.run_in_executor(self._executor, self.backend.compact_if_due)
+                except Exception as e:
+                    # The batch is safe in the journal; compaction is retried
+                    # after the next batch and on close
+                    print(f"Journal compaction failed: {e}")
+
+
+def encode_cursor(order, cursor):
+    """Turn a ContactPage cursor into an opaque URL-safe token (None stays None)"""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps([order, *cursor]).encode()).decode()
+
+
+def decode_cursor(order, token):
+    """Recover the cursor from a token, checking it was issued for this order"""
+    try:
+        cursor_order, value, key = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise HTTPError(400, "Invalid cursor")
+    if cursor_order != order:
+        raise HTTPError(400, f"Cursor is for order '{cursor_order}', not '{order}'")
+    return (value, key)
+
+
+def _page_arguments(query):
+    try:
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', [str(DEFAULT_PAGE_SIZE)])[0])
+    except ValueError:
+        raise HTTPError(400, "offset and limit must be integers")
+    if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        raise HTTPError(400, f"offset must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}")
+    return offset, limit
+
+
+class ContactHTTPServer:
+    """Minimal HTTP/1.1 JSON front end (keep-alive, Content-Length bodies) for a ContactService"""
+
+    def __init__(self, service, host='127.0.0.1', port=DEFAULT_PORT):
+        self.service = service
+        self.host = host
+        self.port = port
+        self._server = None
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self):
+        await self.service.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.service.close()
+
+    async def dispatch(self, method, target, body):
+        """Route one request, returning (status, JSON payload)"""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        service = self.service
+
+        if parts[0] == 'contacts' and len(parts) == 1:
+            if method == 'GET':
+                _, limit = _page_arguments(query)
+                order = query.get('order', ['added'])[0]
+                if order not in SORT_ORDERS:
+                    raise HTTPError(400, f"order must be one of {', '.join(SORT_ORDERS)}")
+                cursor = query.get('cursor', [None])[0]
+                if cursor is not None:
+                    cursor = decode_cursor(order, cursor)
+                page, total = service.list(order, cursor, limit)
+                return 200, {'contacts': page.contacts, 'total': total,
+                             'next_cursor': encode_cursor(order, page.cursor)}
+            if method == 'POST':
+                try:
+                    record = json.loads(body)
+                except ValueError:
+                    raise HTTPError(400, "Body must be JSON")
+                if not isinstance(record, dict):
+                    raise HTTPError(400, "Body must be a JSON object")
+                try:
+                    return 201, await service.add(record)
+                except DuplicateContactError as e:
+                    raise HTTPError(409, str(e))
+                except ValueError as e:
+                    raise HTTPError(400, str(e))
+            raise HTTPError(405, f"{method} not allowed on /contacts")
+
+        if parts[0] == 'contacts' and len(parts) == 2:
+            if method == 'GET':
+                contact = service.get(parts[1])
+            elif method == 'DELETE':
+                contact = await service.delete(parts[1])
+            else:
+                raise HTTPError(405, f"{method} not allowed on /contacts/<name>")
+            if contact is None:
+                raise HTTPError(404, f"Contact '{parts[1]}' not found")
+            return 200, contact
+
+        if parts == ['search']:
+            if method != 'GET':
+                raise HTTPError(405, f"{method} not allowed on /search")
+            term = query.get('q', [''])[0].strip()
+            mode = query.get('mode', ['substring'])[0]
+            if not term:
+                raise HTTPError(400, "Search term cannot be empty")
+            if mode not in SEARCH_MODES:
+                raise HTTPError(400, f"mode must be one of {', '.join(SEARCH_MODES)}")
+            offset, limit = _page_arguments(query)
+            page = service.search(term, mode, offset, limit)
+            return 200, {'contacts': page.contacts, 'total': page.total, 'offset': offset,
+                         'limit': limit}
+
+        raise HTTPError(404, f"No route for {url.path}")
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' \
+                    else connection == 'keep-alive'
+
+                length = int(headers.get('content-length') or 0)
+                try:
+                    if length > MAX_BODY_SIZE:
+                        keep_alive = False
+                        raise HTTPError(413, f"Body over {MAX_BODY_SIZE} bytes")
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                connection = '' if keep_alive else 'Connection: close\r\n'
+                head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                        f"Content-Type: application/json\r\n"
+                        f"Content-Length: {len(data)}\r\n{connection}\r\n")
+                writer.write(head.encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def _request(reader, writer, method, path, payload=None):
+    """Send one keep-alive request and return (status, decoded JSON body)"""
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+                 .encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def run_load(host, port, clients=20, requests=200, write_ratio=0.1, seed=0):
+    """
+    Drive the server from many concurrent keep-alive connections
+
+    Each client mixes searches, list pages and lookups with writes (adds,
+    and deletes of contacts it added earlier) in the given proportion.
+
+    Returns:
+        Dict with request count, seconds, requests/sec, latency percentiles
+        in milliseconds and a count of responses per status
+    """
+    words = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi',
+             'smith', 'jones', 'brown', 'garcia', 'miller', 'davis', 'lopez', 'wilson']
+    latencies = []
+    statuses = {}
+
+    async def client(number):
+        rng = random.Random(seed * 1000 + number)
+        reader, writer = await asyncio.open_connection(host, port)
+        added = []
+        cursor = None
+        try:
+            for i in range(requests):
+                roll = rng.random()
+                if roll < write_ratio:
+                    if added and rng.random() < 0.3:
+                        request = ('DELETE', f"/contacts/{quote(added.pop())}", None)
+                    else:
+                        name = f"{rng.choice(words).title()} {rng.choice(words).title()} {number}-{i}"
+                        added.append(name)
+                        request = ('POST', '/contacts',
+                                   {'name': name, 'email': f"c{number}.{i}@example.com",
+                                    'phone': f"555-{rng.randrange(10000):04d}"})
+                elif roll < write_ratio + (1 - write_ratio) * 0.6:
+                    term = rng.choice(words)[:rng.randint(3, 5)]
+                    mode = rng.choice(SEARCH_MODES[:2])
+                    request = ('GET', f"/search?q={term}&mode={mode}&limit=20", None)
+                elif roll < write_ratio + (1 - write_ratio) * 0.8 or not added:
+                    # Page through the name order, starting over at the end
+                    request = ('GET', f"/contacts?order=name&limit=20"
+                                      f"{'&cursor=' + cursor if cursor else ''}", None)
+                else:
+                    request = ('GET', f"/contacts/{quote(rng.choice(added))}", None)
+                started = time.perf_counter()
+                status, body = await _request(reader, writer, *request)
+                if request[1].startswith('/contacts?'):
+                    cursor = body.get('next_cursor')
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'statuses': statuses,
+    }
+
+
+async def _serve(args):
+    backend = STORAGE_BACKENDS[args.backend](args.file)
+    server = ContactHTTPServer(ContactService(backend), args.host, args.port)
+    await server.start()
+    print(f"Serving {len(server.service.store)} contacts on http://{args.host}:{server.address[1]}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+async def _load(args):
+    server = None
+    port = args.port
+    if args.local:
+        # A throwaway server on a temporary contacts file
+        directory = tempfile.mkdtemp(prefix='contacts-')
+        backend = STORAGE_BACKENDS['journal'](os.path.join(directory, 'contacts.json'))
+        server = ContactHTTPServer(ContactService(backend), args.host, 0)
+        await server.start()
+        port = server.address[1]
+    try:
+        result = await run_load(args.host, port, args.clients, args.requests,
+                                args.write_ratio, args.seed)
+    finally:
+        if server is not None:
+            await server.close()
+    print(f"{result['requests']} requests from {args.clients} clients in "
+          f"{result['seconds']:.2f}s: {result['requests_per_sec']:,.0f} req/s")
+    print(f"latency p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, "
+          f"p99 {result['p99_ms']:.2f} ms")
+    print(f"statuses: {result['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Contact service and load generator")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="serve the contacts over HTTP/JSON")
+    serve.add_argument('--file', default='contacts.json', help="snapshot (or SQLite) file")
+    serve.add_argument('--backend', choices=sorted(STORAGE_BACKENDS), default='journal')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    load = commands.add_parser('load', help="run concurrent clients against a server")
+    load.add_argument('--host', default='127.0.0.1')
+    load.add_argument('--port', type=int, default=DEFAULT_PORT)
+    load.add_argument('--local', action='store_true',
+                      help="start a server on a temporary contacts file first")
+    load.add_argument('--clients', type=int, default=20)
+    load.add_argument('--requests', type=int, default=200, help="requests per client")
+    load.add_argument('--write-ratio', type=float, default=0.1)
+    load.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args) if args.command == 'serve' else _load(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
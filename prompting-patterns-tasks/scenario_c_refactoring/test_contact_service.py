@@ -0,0 +1,52 @@
+"""Crash-recovery checks for the contact service's batching writer"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from contact_manager import JournalBackend
+from contact_service import ContactService
+
+
+class WriterCrashReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'contacts.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _add_then_crash(self, names, together):
+        async def run():
+            service = ContactService(JournalBackend(self.path, compact_every=3, fsync=False))
+            await service.start()
+            adds = [service.add({'name': name}) for name in names]
+            if together:
+                await asyncio.gather(*adds)
+            else:
+                for add in adds:
+                    await add
+            # Crash: stop the writer without close(), so nothing compacts on the way out
+            service._writer.cancel()
+            service._executor.shutdown()
+            service.backend._journal.close()
+        asyncio.run(run())
+
+    def _reload(self):
+        backend = JournalBackend(self.path)
+        names = [contact['name'] for contact in backend.load()]
+        backend.close()
+        return names
+
+    def test_acknowledged_writes_survive_compaction_then_crash(self):
+        self._add_then_crash(['P0', 'P1', 'P2'], together=False)
+        self.assertEqual(self._reload(), ['P0', 'P1', 'P2'])
+
+    def test_batched_writes_survive_compaction_then_crash(self):
+        self._add_then_crash(['P0', 'P1', 'P2', 'P3'], together=True)
+        self.assertEqual(self._reload(), ['P0', 'P1', 'P2', 'P3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
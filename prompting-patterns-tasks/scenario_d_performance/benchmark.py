@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+CSV Pipeline Benchmark
+======================
+
+Times the columnar csv_processor pipeline (load, aggregate, top-K, report)
+on generated data of increasing size and records the results as JSON.
+
+    python benchmark.py --rows 10000 100000 1000000
+    python benchmark.py --compare bench_results_old.json
+
+Each size runs in a fresh process so peak RSS is measured per size. With
+--compare, stages that got slower than --threshold are reported and the
+exit status is 1.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from csv_processor import SlowCSVProcessor, generate_sales_csv
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ('load', 'aggregate', 'top_k', 'report')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, if the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_size(num_rows, num_products, skew, seed, data_dir):
+    """Generate one dataset and time every stage on it"""
+    data_file = os.path.join(data_dir, f"sales_{num_rows}_{num_products}_{seed}.csv")
+    report_file = os.path.join(data_dir, f"report_{num_rows}.txt")
+    if not os.path.exists(data_file):
+        started = time.perf_counter()
+        generate_sales_csv(data_file, num_rows, num_products=num_products, skew=skew, seed=seed)
+        print(f"  generated {num_rows:,} rows in {time.perf_counter() - started:.2f}s", flush=True)
+
+    processor = SlowCSVProcessor()
+    stages = {}
+    # The processor prints progress for every call, keep it out of the way
+    with contextlib.redirect_stdout(io.StringIO()):
+        for stage in STAGES:
+            started = time.perf_counter()
+            if stage == 'load':
+                processor.load_csv_columnar(data_file)
+            elif stage == 'aggregate':
+                totals = processor.calculate_totals()
+            elif stage == 'top_k':
+                processor.find_top_products(10, totals=totals)
+            else:
+                processor.generate_report(totals=totals, filename=report_file)
+            seconds = time.perf_counter() - started
+            stages[stage] = {'seconds': seconds,
+                             'rows_per_sec': num_rows / seconds if seconds else None}
+
+    return {
+        'rows': num_rows,
+        'products': num_products,
+        'file_mb': os.path.getsize(data_file) / (1024 * 1024),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print per-stage timing ratios against a previous run, return the regressions"""
+    previous = {(r['rows'], r['products']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['rows'], result['products']))
+        if old is None:
+            continue
+        for stage, timing in result['stages'].items():
+            old_seconds = old['stages'].get(stage, {}).get('seconds')
+            if not old_seconds:
+                continue
+            ratio = timing['seconds'] / old_seconds
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions.append((result['rows'], stage, ratio))
+            print(f"  {result['rows']:>12,} rows  {stage:<10} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CSV processing pipeline")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="dataset sizes to run (default: 10k 100k 1M)")
+    parser.add_argument('--products', type=int, default=1000, help="product cardinality")
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf skew of product popularity")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help="where to keep generated data (default: a temp dir)")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="previous results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="slowdown ratio counted as a regression (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        data_dir = args.data_dir or stack.enter_context(tempfile.TemporaryDirectory())
+        results = []
+        for num_rows in args.rows:
+            print(f"Benchmarking {num_rows:,} rows...", flush=True)
+            # A fresh process per size so peak RSS belongs to that size only
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(run_size, num_rows, args.products, args.skew,
+                                     args.seed, data_dir).result()
+            results.append(result)
+            timings = ', '.join(f"{stage} {timing['seconds']:.3f}s"
+                                for stage, timing in result['stages'].items())
+            print(f"  {timings}, peak RSS {result['peak_rss_mb'] or 0:.1f} MB")
+
+    output = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'products': args.products,
+            'skew': args.skew,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,659 @@ Practice Challenge: Use the "Performance" prompt pattern to optimise this
 """
 
 import csv
+import heapq
+import io
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import random
+import stat
+import struct
+import sys
+import tempfile
 import time
-from datetime import datetime
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from datetime import date, datetime, timedelta
+
+# Roughly how many bytes of text are parsed per chunk by the columnar loader
+CHUNK_SIZE = 1 << 20
+
+
+class ColumnarSalesData:
+    """Sales rows stored as typed column arrays instead of one dict per row
+
+    Dates are day ordinals, products are integer codes into product_names,
+    sales are float64 and quantities are int32.
+    """
+
+    def __init__(self, shared=None):
+        self.dates = array('i')
+        self.products = array('i')
+        self.sales = array('d')
+        self.quantities = array('i')
+        if shared is None:
+            self.product_names = []
+            self._product_codes = {}
+            self._date_ordinals = {}
+        else:
+            # Chunks of one file share the product dictionary so codes line up
+            self.product_names = shared.product_names
+            self._product_codes = shared._product_codes
+            self._date_ordinals = shared._date_ordinals
+
+    def __len__(self):
+        return len(self.sales)
+
+    def product_code(self, name):
+        """Return the code for a product name, adding it to the dictionary if new"""
+        code = self._product_codes.get(name)
+        if code is None:
+            code = len(self.product_names)
+            self.product_names.append(name)
+            self._product_codes[name] = code
+        return code
+
+    def date_ordinal(self, text):
+        """Convert an ISO date string to a day ordinal (cached, dates repeat a lot)"""
+        ordinal = self._date_ordinals.get(text)
+        if ordinal is None:
+            ordinal = date.fromisoformat(text).toordinal()
+            self._date_ordinals[text] = ordinal
+        return ordinal
+
+    def append_rows(self, rows, columns):
+        """Append parsed CSV rows, using the (date, product, sales, quantity) column indexes"""
+        rows = [row for row in rows if row]
+        if not rows:
+            return
+        date_col, product_col, sales_col, quantity_col = columns
+        fields = list(zip(*rows))
+
+        codes = self._product_codes
+        date_ordinals = self._date_ordinals
+        self.dates.extend([date_ordinals[d] if d in date_ordinals else self.date_ordinal(d)
+                           for d in fields[date_col]])
+        self.products.extend([codes[p] if p in codes else self.product_code(p)
+                              for p in fields[product_col]])
+        self.sales.extend(map(float, fields[sales_col]))
+        self.quantities.extend(map(int, fields[quantity_col]))
+
+    def extend(self, other):
+        """Append the rows of a chunk that shares this dictionary"""
+        self.dates.extend(other.dates)
+        self.products.extend(other.products)
+        self.sales.extend(other.sales)
+        self.quantities.extend(other.quantities)
+
+    def product_totals(self):
+        """Sum sales, quantity and row count per product code in a single pass"""
+        size = len(self.product_names)
+        sales = [0.0] * size
+        quantities = [0] * size
+        counts = [0] * size
+        for code, amount, quantity in zip(self.products, self.sales, self.quantities):
+            sales[code] += amount
+            quantities[code] += quantity
+            counts[code] += 1
+        return sales, quantities, counts
+
+
+def _header_columns(header):
+    """Find the positions of the columns the processor needs"""
+    try:
+        return tuple(header.index(name) for name in ('date', 'product', 'sales', 'quantity'))
+    except ValueError:
+        raise ValueError(f"CSV header must contain date, product, sales and quantity: {header}")
+
+
+def iter_csv_chunks(filename, chunk_size=CHUNK_SIZE, shared=None):
+    """Parse a sales CSV into ColumnarSalesData chunks of about chunk_size bytes
+
+    Only one chunk of text is held in memory at a time. Every chunk shares the
+    product dictionary of `shared` (or of the first chunk) so codes line up.
+    """
+    with open(filename, 'r', newline='') as file:
+        columns = _header_columns(next(csv.reader([file.readline()])))
+        while True:
+            lines = file.readlines(chunk_size)
+            if not lines:
+                break
+            chunk = ColumnarSalesData(shared)
+            chunk.append_rows(csv.reader(lines), columns)
+            shared = chunk
+            yield chunk
+
+
+def split_line_ranges(filename, parts):
+    """Split the data rows of a CSV into up to `parts` byte ranges on line boundaries
+
+    Returns the (start, end) ranges and the header column indexes.
+    """
+    with open(filename, 'rb') as file:
+        header = file.readline()
+        data_start = file.tell()
+        file_size = os.fstat(file.fileno()).st_size
+        step = max((file_size - data_start) // max(parts, 1), 1)
+
+        offsets = [data_start]
+        for guess in range(data_start + step, file_size, step):
+            if guess <= offsets[-1]:
+                continue
+            # Move each split point forward to the start of the next line
+            file.seek(guess - 1)
+            file.readline()
+            offset = file.tell()
+            if offset >= file_size:
+                break
+            if offset > offsets[-1]:
+                offsets.append(offset)
+        offsets.append(file_size)
+
+    columns = _header_columns(next(csv.reader([header.decode()])))
+    ranges = [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
+    return ranges, columns
+
+
+def aggregate_byte_range(filename, start, end, columns, chunk_size=CHUNK_SIZE):
+    """Worker: per-product [sales, quantity, count] for the rows in one byte range
+
+    Returns the partial totals, the number of rows and the seconds spent.
+    """
+    started = time.perf_counter()
+    date_col, product_col, sales_col, quantity_col = columns
+    partials = {}
+    rows_seen = 0
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        remaining = end - start
+        carry = b''
+        while remaining > 0:
+            block = file.read(min(chunk_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            block = carry + block
+            cut = block.rfind(b'\n') + 1 if remaining > 0 else len(block)
+            carry = block[cut:]
+            # Split lines as open(newline='') does; str.splitlines also breaks on \x0b, \x85, \u2028...
+            for row in csv.reader(io.StringIO(block[:cut].decode(), newline='')):
+                if not row:
+                    continue
+                totals = partials.get(row[product_col])
+                if totals is None:
+                    totals = partials[row[product_col]] = [0.0, 0, 0]
+                totals[0] += float(row[sales_col])
+                totals[1] += int(row[quantity_col])
+                totals[2] += 1
+                rows_seen += 1
+    return partials, rows_seen, time.perf_counter() - started
+
+
+def merge_partials(merged, partials):
+    """Add per-product [sales, quantity, count] partials into merged (in place)"""
+    for product, (sales, quantity, count) in partials.items():
+        totals = merged.get(product)
+        if totals is None:
+            merged[product] = [sales, quantity, count]
+        else:
+            totals[0] += sales
+            totals[1] += quantity
+            totals[2] += count
+    return merged
+
+
+def totals_from_partials(merged):
+    """Expand [sales, quantity, count] sums into the calculate_totals structure"""
+    totals = {}
+    for product, (sales, quantity, count) in merged.items():
+        totals[product] = {
+            'total_sales': sales,
+            'total_quantity': quantity,
+            'count': count,
+            'avg_sales': sales / count,
+            'avg_quantity': quantity / count
+        }
+    return totals
+
+
+# Ranking metrics over per-product [sales, quantity, count] sums
+METRICS = {
+    'total_sales': lambda sums: sums[0],
+    'total_quantity': lambda sums: sums[1],
+    'count': lambda sums: sums[2],
+    'avg_sales_per_unit': lambda sums: sums[0] / sums[1] if sums[1] else 0.0,
+}
+
+# Metrics that are plain per-row weights, usable by the approximate counters
+ROW_WEIGHTS = {
+    'total_sales': lambda sales, quantity: sales,
+    'total_quantity': lambda sales, quantity: quantity,
+    'count': lambda sales, quantity: 1,
+}
+
+
+def _metric(name, table=METRICS):
+    try:
+        return table[name]
+    except KeyError:
+        raise ValueError(f"Unknown metric '{name}', expected one of {sorted(table)}")
+
+
+class StreamingTopK:
+    """Exact top-K products, updated as rows arrive and ranked with a bounded heap
+
+    Per-product sums are kept so the ranking can be read at any point of the
+    stream by any metric in METRICS, in O(products * log k).
+    """
+
+    def __init__(self):
+        self._sums = {}
+
+    def add(self, product, sales, quantity):
+        """Add one row"""
+        sums = self._sums.get(product)
+        if sums is None:
+            self._sums[product] = [sales, quantity, 1]
+        else:
+            sums[0] += sales
+            sums[1] += quantity
+            sums[2] += 1
+
+    def add_chunk(self, chunk):
+        """Add every row of a ColumnarSalesData chunk"""
+        sales, quantities, counts = chunk.product_totals()
+        merge_partials(self._sums, {
+            product: (sales[code], quantities[code], counts[code])
+            for code, product in enumerate(chunk.product_names) if counts[code]
+        })
+
+    def add_totals(self, totals):
+        """Add a calculate_totals result"""
+        merge_partials(self._sums, {
+            product: (data['total_sales'], data['total_quantity'], data['count'])
+            for product, data in totals.items()
+        })
+
+    def top(self, k, metric='total_sales'):
+        """Return the k best (product, score) pairs, best first"""
+        score = _metric(metric)
+        best = heapq.nlargest(k, self._sums.items(), key=lambda item: score(item[1]))
+        return [(product, score(sums)) for product, sums in best]
+
+
+class SpaceSavingTopK:
+    """Approximate heavy hitters in bounded memory (Space-Saving algorithm)
+
+    At most `capacity` counters are kept. An unseen product replaces the
+    smallest counter and inherits its count, so every estimate is an upper
+    bound that overshoots by at most the recorded error.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._counts = {}
+        self._errors = {}
+        self._heap = []  # (count, product) entries, some of them stale
+
+    def add(self, product, weight=1):
+        counts = self._counts
+        if product in counts:
+            counts[product] += weight
+        elif len(counts) < self.capacity:
+            counts[product] = weight
+            self._errors[product] = 0
+        else:
+            floor, victim = self._pop_min()
+            del counts[victim]
+            del self._errors[victim]
+            counts[product] = floor + weight
+            self._errors[product] = floor
+        heapq.heappush(self._heap, (counts[product], product))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, item) for item, count in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        """Pop the smallest live counter, skipping stale heap entries"""
+        while True:
+            count, product = heapq.heappop(self._heap)
+            if self._counts.get(product) == count:
+                return count, product
+
+    def top(self, k):
+        """Return the k largest (product, estimated weight, max error) triples"""
+        best = heapq.nlargest(k, self._counts.items(), key=lambda item: item[1])
+        return [(product, count, self._errors[product]) for product, count in best]
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+class CountMinTopK:
+    """Approximate heavy hitters from a Count-Min sketch plus k tracked candidates
+
+    Memory is width * depth counters regardless of product cardinality.
+    Estimates never undercount; collisions can only inflate them.
+    """
+
+    def __init__(self, k=10, width=2048, depth=4):
+        self.k = k
+        self.width = width
+        self._rows = [array('d', bytes(8 * width)) for _ in range(depth)]
+        # One pairwise-independent hash ((a * h + b) mod p) per row
+        seeds = random.Random(depth)
+        self._hashes = [(seeds.randrange(1, _MERSENNE_PRIME), seeds.randrange(_MERSENNE_PRIME))
+                        for _ in range(depth)]
+        self._candidates = {}
+
+    def _cells(self, product):
+        h = hash(product)
+        return [(a * h + b) % _MERSENNE_PRIME % self.width for a, b in self._hashes]
+
+    def estimate(self, product):
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(product)))
+
+    def add(self, product, weight=1):
+        estimate = None
+        for row, cell in zip(self._rows, self._cells(product)):
+            row[cell] += weight
+            if estimate is None or row[cell] < estimate:
+                estimate = row[cell]
+
+        candidates = self._candidates
+        if product in candidates or len(candidates) < self.k:
+            candidates[product] = estimate
+            return
+        weakest = min(candidates, key=candidates.get)
+        if estimate > candidates[weakest]:
+            del candidates[weakest]
+            candidates[product] = estimate
+
+    def top(self, k=None):
+        """Return up to k (product, estimated weight) pairs, best first"""
+        best = sorted(((product, self.estimate(product)) for product in self._candidates),
+                      key=lambda item: item[1], reverse=True)
+        return best[:k]
+
+
+# Date buckets for group_by: day ordinal -> bucket label
+PERIODS = {
+    'date': lambda day: day.isoformat(),
+    'day': lambda day: day.isoformat(),
+    'week': lambda day: (day - timedelta(days=day.weekday())).isoformat(),
+    'month': lambda day: f"{day.year}-{day.month:02d}",
+    'year': lambda day: str(day.year),
+}
+
+AGGREGATE_STATS = ('sum', 'count', 'mean', 'min', 'max')
+
+
+def group_by(columns, by=('product',), values=('sales', 'quantity'), stats=AGGREGATE_STATS):
+    """Hash-aggregate ColumnarSalesData in a single pass
+
+    `by` mixes plain columns (product, quantity) with date buckets (date/day,
+    week, month, year). Returns {group key tuple: {'<value>_<stat>': ...}},
+    sorted by key, with a 'count' entry per group.
+    """
+    for stat in stats:
+        if stat not in AGGREGATE_STATS:
+            raise ValueError(f"Unknown statistic '{stat}', expected one of {AGGREGATE_STATS}")
+    value_arrays = []
+    for name in values:
+        if name not in ('sales', 'quantity'):
+            raise ValueError(f"Can only aggregate sales and quantity, not '{name}'")
+        value_arrays.append(columns.sales if name == 'sales' else columns.quantities)
+
+    # Key parts stay integer codes during the pass and are decoded per group
+    key_arrays = []
+    decoders = []
+    for name in by:
+        if name == 'product':
+            key_arrays.append(columns.products)
+            decoders.append(columns.product_names.__getitem__)
+        elif name == 'quantity':
+            key_arrays.append(columns.quantities)
+            decoders.append(None)
+        elif name in PERIODS:
+            label = PERIODS[name]
+            buckets = {ordinal: label(date.fromordinal(ordinal)) for ordinal in set(columns.dates)}
+            key_arrays.append(columns.dates)
+            decoders.append(buckets.__getitem__)
+        else:
+            raise ValueError(f"Cannot group by '{name}'")
+
+    groups = {}
+    keys = zip(*key_arrays) if key_arrays else [()] * len(columns)
+    # With no value columns, zip(*value_arrays) is empty; still count every row
+    rows = zip(*value_arrays) if value_arrays else itertools.repeat(())
+    for key, row in zip(keys, rows):
+        acc = groups.get(key)
+        if acc is None:
+            acc = groups[key] = [0, [0] * len(row), list(row), list(row)]
+        acc[0] += 1
+        sums, mins, maxs = acc[1], acc[2], acc[3]
+        for i, value in enumerate(row):
+            sums[i] += value
+            if value < mins[i]:
+                mins[i] = value
+            elif value > maxs[i]:
+                maxs[i] = value
+
+    result = {}
+    for key, (count, sums, mins, maxs) in groups.items():
+        key = tuple(part if decode is None else decode(part) for part, decode in zip(key, decoders))
+        row = {'count': count}
+        for i, name in enumerate(values):
+            computed = {'sum': sums[i], 'count': count, 'mean': sums[i] / count,
+                        'min': mins[i], 'max': maxs[i]}
+            for stat in stats:
+                row[f"{name}_{stat}"] = computed[stat]
+        result[key] = row
+    return dict(sorted(result.items()))
+
+
+REPORT_COLUMNS = ['product', 'total_sales', 'total_quantity', 'count',
+                  'avg_sales', 'avg_quantity', 'rank']
+
+
+def _report_rows(totals, top_products):
+    """Yield one dict per product, with its rank if it is a top product"""
+    ranks = {product: rank for rank, (product, _) in enumerate(top_products, 1)}
+    for product, data in totals.items():
+        yield {'product': product, 'total_sales': data['total_sales'],
+               'total_quantity': data['total_quantity'], 'count': data['count'],
+               'avg_sales': data['avg_sales'], 'avg_quantity': data['avg_quantity'],
+               'rank': ranks.get(product)}
+
+
+def render_text(totals, top_products, out):
+    out.write("Sales Report\n")
+    out.write("=" * 50 + "\n\n")
+    for product, data in totals.items():
+        out.write(f"Product: {product}\n"
+                  f"Total Sales: ${data['total_sales']:.2f}\n"
+                  f"Average Sales: ${data['avg_sales']:.2f}\n\n")
+    out.write("Top Products:\n")
+    for i, (product, sales) in enumerate(top_products, 1):
+        out.write(f"{i}. {product}: ${sales:.2f}\n")
+
+
+def render_csv(totals, top_products, out):
+    writer = csv.DictWriter(out, fieldnames=REPORT_COLUMNS, lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(_report_rows(totals, top_products))
+
+
+def render_jsonl(totals, top_products, out):
+    out.writelines(json.dumps(row) + "\n" for row in _report_rows(totals, top_products))
+
+
+REPORT_FORMATS = {
+    'text': render_text,
+    'csv': render_csv,
+    'jsonl': render_jsonl,
+}
+
+
+def _file_mode(path):
+    """Permission bits for path: the existing file's, or what the umask gives a new file"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def atomic_write(path, *parts):
+    """Write str or bytes-like parts to path via a temp file in the same directory and a rename
+
+    The temp file gets path's permissions (NamedTemporaryFile creates it 0600)
+    and is fsynced before the rename; a failed write removes it.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    binary = not isinstance(parts[0], str)
+    mode = _file_mode(path)
+    with tempfile.NamedTemporaryFile('wb' if binary else 'w', dir=directory,
+                                     delete=False, suffix='.tmp') as temp:
+        try:
+            for part in parts:
+                temp.write(part)
+            temp.flush()
+            os.chmod(temp.name, mode)
+            os.fsync(temp.fileno())
+        except BaseException:
+            temp.close()
+            os.unlink(temp.name)
+            raise
+    os.replace(temp.name, path)
+
+
+def write_parquet_report(path, totals, top_products):
+    """Write the report rows as Parquet (needs pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet reports need pyarrow: pip install pyarrow")
+    rows = list(_report_rows(totals, top_products))
+    table = pa.table({column: [row[column] for row in rows] for column in REPORT_COLUMNS})
+    buffer = pa.BufferOutputStream()
+    pq.write_table(table, buffer)
+    atomic_write(path, buffer.getvalue().to_pybytes())
+
+
+# Binary sidecar: header, then sales (float64), dates, products and quantities
+# (int32) in native byte order, then the product dictionary as a JSON list
+SIDECAR_MAGIC = b'SALESCOL'
+SIDECAR_VERSION = 1
+# magic, version, little-endian, source size, source mtime_ns, rows, dictionary bytes,
+# reserved, source sha1
+_SIDECAR_HEADER = struct.Struct('<8sI?QqQQQ20s')
+
+
+def _file_sha1(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def source_stamp(source):
+    """(size, mtime_ns, sha1) of a source file, to take before parsing it (see write_sidecar)"""
+    info = os.stat(source)
+    return info.st_size, info.st_mtime_ns, _file_sha1(source)
+
+
+def write_sidecar(columns, source, path, stamp=None):
+    """Write loaded columns to a binary sidecar stamped with the source's size, mtime and hash
+
+    stamp is source_stamp(source) taken before the columns were parsed. A
+    stamp taken afterwards would match a file that grew in between, and
+    the sidecar would then hide the new rows from every later load.
+    """
+    size, mtime_ns, sha1 = stamp or source_stamp(source)
+    dictionary = json.dumps(columns.product_names).encode()
+    header = _SIDECAR_HEADER.pack(SIDECAR_MAGIC, SIDECAR_VERSION, sys.byteorder == 'little',
+                                  size, mtime_ns, len(columns), len(dictionary), 0, sha1)
+    padding = b'\0' * (-len(header) % 8)
+    atomic_write(path, header, padding, columns.sales, columns.dates,
+                 columns.products, columns.quantities, dictionary)
+
+
+def open_sidecar(source, path, verify_hash=False):
+    """Map a sidecar written by write_sidecar and return zero-copy columns
+
+    Returns None if the sidecar is missing, from another format version or
+    byte order, stale (source size/mtime changed, or hash with verify_hash),
+    or truncated or corrupt, so the caller parses the CSV again.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < _SIDECAR_HEADER.size:
+        return None
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (magic, version, little_endian, size, mtime_ns, rows,
+     dictionary_size, _, sha1) = _SIDECAR_HEADER.unpack_from(mapped)
+    info = os.stat(source)
+    offset = _SIDECAR_HEADER.size + (-_SIDECAR_HEADER.size % 8)
+    if (magic != SIDECAR_MAGIC or version != SIDECAR_VERSION
+            or little_endian != (sys.byteorder == 'little')
+            or (size, mtime_ns) != (info.st_size, info.st_mtime_ns)
+            or len(mapped) != offset + rows * (8 + 4 + 4 + 4) + dictionary_size
+            or (verify_hash and sha1 != _file_sha1(source))):
+        mapped.close()
+        return None
+
+    try:
+        product_names = json.loads(mapped[len(mapped) - dictionary_size:])
+    except ValueError:
+        mapped.close()
+        return None
+    view = memoryview(mapped)
+    columns = ColumnarSalesData()
+    for name, code, width in (('sales', 'd', 8), ('dates', 'i', 4),
+                              ('products', 'i', 4), ('quantities', 'i', 4)):
+        setattr(columns, name, view[offset:offset + rows * width].cast(code))
+        offset += rows * width
+    columns.product_names.extend(product_names)
+    columns._product_codes.update((name, code) for code, name in enumerate(columns.product_names))
+    # Keep the mapping alive as long as the column views are
+    columns._mmap = mapped
+    return columns
+
+
+def _rfind_newline(file, floor, ceiling, block_size=1 << 16):
+    """Offset of the last newline in file[floor:ceiling], or -1"""
+    position = ceiling
+    while position > floor:
+        start = max(floor, position - block_size)
+        file.seek(start)
+        index = file.read(position - start).rfind(b'\n')
+        if index >= 0:
+            return start + index
+        position = start
+    return -1
+
+
+def _checksum(file, start, end):
+    file.seek(start)
+    return zlib.crc32(file.read(end - start))
+
 
 class SlowCSVProcessor:
     def __init__(self):
         self.data = []
         self.processed_data = []
+        # Set by load_csv_columnar; aggregations use it instead of self.data
+        self.columns = None
+        # Per-worker throughput from the last calculate_totals_parallel call
+        self.worker_stats = []
         
     def load_csv(self, filename):
         """Load CSV file - inefficiently!"""
@@ -36,6 +682,42 @@ class SlowCSVProcessor:
         
         load_time = time.time() - start_time
         print(f"Loaded {len(self.data)} rows in {load_time:.2f} seconds")
+
+    def load_csv_columnar(self, filename, chunk_size=CHUNK_SIZE):
+        """Load CSV file in fixed-size chunks into typed column arrays"""
+        print(f"Loading {filename} (columnar)...")
+        start_time = time.time()
+
+        columns = ColumnarSalesData()
+        for chunk in iter_csv_chunks(filename, chunk_size, shared=columns):
+            columns.extend(chunk)
+        self.columns = columns
+
+        load_time = time.time() - start_time
+        print(f"Loaded {len(columns)} rows in {load_time:.2f} seconds")
+
+    def load_csv_cached(self, filename, sidecar=None, verify_hash=False):
+        """Load columns from a memory-mapped binary sidecar, building it on first use
+
+        The sidecar (default: <filename>.cols) is rebuilt whenever the source's
+        size or mtime changes. Its column arrays are read-only views of the
+        mapping, so processes loading the same file share the page cache.
+        """
+        sidecar = sidecar or filename + '.cols'
+        start_time = time.time()
+
+        columns = open_sidecar(filename, sidecar, verify_hash)
+        if columns is None:
+            # Stamped before parsing, so rows appended meanwhile make it stale
+            stamp = source_stamp(filename)
+            self.load_csv_columnar(filename)
+            write_sidecar(self.columns, filename, sidecar, stamp)
+            print(f"Wrote binary cache {sidecar}")
+            return
+
+        self.columns = columns
+        load_time = time.time() - start_time
+        print(f"Loaded {len(columns)} rows from {sidecar} in {load_time:.3f} seconds")
         
     def process_single_row(self, row):
         """Process a single row - with unnecessary calculations"""
@@ -56,6 +738,12 @@ class SlowCSVProcessor:
         """Calculate totals - very inefficient!"""
         print("Calculating totals...")
         start_time = time.time()
+
+        if self.columns is not None:
+            totals = self._columnar_totals()
+            calc_time = time.time() - start_time
+            print(f"Calculated totals in {calc_time:.2f} seconds")
+            return totals
         
         totals = {}
         
@@ -84,77 +772,247 @@ class SlowCSVProcessor:
         print(f"Calculated totals in {calc_time:.2f} seconds")
         
         return totals
+
+    def calculate_totals_parallel(self, filename, workers=None):
+        """Calculate totals straight from the file across a pool of processes
+
+        The rows are split into line-aligned byte ranges, each worker sums its
+        range and the partials are merged into the calculate_totals structure.
+        """
+        workers = workers or os.cpu_count() or 1
+        print(f"Calculating totals with {workers} workers...")
+        start_time = time.time()
+
+        ranges, columns = split_line_ranges(filename, workers)
+        merged = {}
+        self.worker_stats = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(aggregate_byte_range, filename, start, end, columns)
+                       for start, end in ranges]
+            # Merge in file order so products keep their first-seen order
+            for worker, future in enumerate(futures):
+                partials, rows, seconds = future.result()
+                merge_partials(merged, partials)
+                rate = rows / seconds if seconds else 0.0
+                self.worker_stats.append({'worker': worker, 'rows': rows,
+                                          'seconds': seconds, 'rows_per_sec': rate})
+                print(f"  worker {worker}: {rows} rows at {rate:,.0f} rows/sec")
+
+        totals = totals_from_partials(merged)
+
+        calc_time = time.time() - start_time
+        print(f"Calculated totals in {calc_time:.2f} seconds")
+        return totals
+
+    def calculate_totals_incremental(self, filename, state_file=None, top_n=5):
+        """Calculate totals for an append-only CSV, parsing only rows added since the last run
+
+        The running sums, top products and the offset and checksum of the last
+        processed row are kept in `state_file` (default: <filename>.state.json).
+        If the header or the last processed row no longer match, the file was
+        truncated or rewritten and the totals are rebuilt from scratch.
+        """
+        state_file = state_file or filename + '.state.json'
+        print(f"Updating totals for {filename}...")
+        start_time = time.time()
+
+        state = None
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                state = json.load(f)
+
+        with open(filename, 'rb') as file:
+            file_size = os.fstat(file.fileno()).st_size
+            header = file.readline()
+            header_checksum = zlib.crc32(header)
+            data_start = file.tell()
+
+            if state is not None and (
+                    state['header_checksum'] != header_checksum
+                    or state['offset'] > file_size
+                    or _checksum(file, state['last_row_offset'], state['offset']) != state['last_row_checksum']):
+                print("Source file was truncated or rewritten, rebuilding totals")
+                state = None
+            if state is None:
+                state = {'offset': data_start, 'last_row_offset': data_start,
+                         'last_row_checksum': zlib.crc32(b''), 'totals': {}}
+
+            # Stop at the last complete line; a writer may be mid-row
+            offset = state['offset']
+            end = _rfind_newline(file, offset, file_size) + 1 or offset
+            if end > offset:
+                last_row_offset = _rfind_newline(file, data_start, end - 1) + 1 or data_start
+                state['last_row_offset'] = last_row_offset
+                state['last_row_checksum'] = _checksum(file, last_row_offset, end)
+
+        merged = state['totals']
+        rows = 0
+        if end > offset:
+            columns = _header_columns(next(csv.reader([header.decode()])))
+            partials, rows, _ = aggregate_byte_range(filename, offset, end, columns)
+            merge_partials(merged, partials)
+
+        totals = totals_from_partials(merged)
+        state['header_checksum'] = header_checksum
+        state['offset'] = end
+        state['top_products'] = self.find_top_products(top_n, totals=totals)
+
+        atomic_write(state_file, json.dumps(state))
+
+        calc_time = time.time() - start_time
+        print(f"Merged {rows} new rows ({end - offset} bytes) in {calc_time:.2f} seconds")
+        return totals
+
+    def aggregate(self, by=('product',), values=('sales', 'quantity'), stats=AGGREGATE_STATS):
+        """Group the loaded columns by any columns and date buckets in one pass
+
+        For example aggregate(by=('product', 'month')) gives a product x month
+        breakdown. Requires load_csv_columnar.
+        """
+        if self.columns is None:
+            raise ValueError("No columnar data loaded, call load_csv_columnar first")
+        print(f"Aggregating by {', '.join(by) or 'nothing'}...")
+        start_time = time.time()
+
+        result = group_by(self.columns, by, values, stats)
+
+        agg_time = time.time() - start_time
+        print(f"Aggregated {len(result)} groups in {agg_time:.2f} seconds")
+        return result
+
+    def _columnar_totals(self):
+        """Build the calculate_totals result from the column arrays"""
+        sales, quantities, counts = self.columns.product_totals()
+        totals = {}
+        for code, product in enumerate(self.columns.product_names):
+            count = counts[code]
+            if not count:
+                continue
+            totals[product] = {
+                'total_sales': sales[code],
+                'total_quantity': quantities[code],
+                'count': count,
+                'avg_sales': sales[code] / count,
+                'avg_quantity': quantities[code] / count
+            }
+        return totals
     
-    def find_top_products(self, n=5):
-        """Find top products - slow sorting algorithm"""
+    def find_top_products(self, n=5, totals=None, metric='total_sales'):
+        """Find the top n products by a metric using a bounded heap
+
+        Pass the result of calculate_totals (or calculate_totals_parallel) as
+        `totals` to rank those instead of rescanning the data. `metric` is one
+        of total_sales, total_quantity, count or avg_sales_per_unit.
+        """
         print(f"Finding top {n} products...")
         start_time = time.time()
-        
-        # PERFORMANCE ISSUE 9: Inefficient sorting with multiple passes
-        product_sales = {}
-        for row in self.data:
-            product = row['product']
-            if product not in product_sales:
-                product_sales[product] = 0
-            product_sales[product] += row['sales']
-        
-        # PERFORMANCE ISSUE 10: Bubble sort instead of built-in sort
-        items = list(product_sales.items())
-        for i in range(len(items)):
-            for j in range(len(items) - 1 - i):
-                if items[j][1] < items[j + 1][1]:
-                    items[j], items[j + 1] = items[j + 1], items[j]
-        
+
+        ranking = StreamingTopK()
+        if totals is not None:
+            ranking.add_totals(totals)
+        elif self.columns is not None:
+            ranking.add_chunk(self.columns)
+        else:
+            for row in self.data:
+                ranking.add(row['product'], row['sales'], row['quantity'])
+        items = ranking.top(n, metric)
+
         sort_time = time.time() - start_time
         print(f"Found top products in {sort_time:.2f} seconds")
         
-        return items[:n]
+        return items
+
+    def find_heavy_hitters(self, filename, n=5, metric='total_sales',
+                           method='space-saving', capacity=1000):
+        """Approximate top products of a file in bounded memory
+
+        Streams the rows through a Space-Saving (`capacity` counters) or
+        Count-Min (`capacity` sketch columns) counter, for product tables
+        too large to aggregate exactly. Averages are not supported.
+        """
+        print(f"Finding approximate top {n} products ({method})...")
+        start_time = time.time()
+
+        weight = _metric(metric, ROW_WEIGHTS)
+        if method == 'space-saving':
+            counter = SpaceSavingTopK(capacity)
+        elif method == 'count-min':
+            counter = CountMinTopK(n, width=capacity)
+        else:
+            raise ValueError(f"Unknown method '{method}', expected 'space-saving' or 'count-min'")
+
+        with open(filename, 'r', newline='') as file:
+            _, product_col, sales_col, quantity_col = _header_columns(next(csv.reader([file.readline()])))
+            while True:
+                lines = file.readlines(CHUNK_SIZE)
+                if not lines:
+                    break
+                for row in csv.reader(lines):
+                    if row:
+                        counter.add(row[product_col],
+                                    weight(float(row[sales_col]), int(row[quantity_col])))
+        items = [(product, estimate) for product, estimate, *_ in counter.top(n)]
+
+        sort_time = time.time() - start_time
+        print(f"Found approximate top products in {sort_time:.2f} seconds")
+        return items
     
-    def generate_report(self):
-        """Generate final report - with unnecessary file operations"""
+    def generate_report(self, totals=None, filename='sales_report.txt', fmt='text'):
+        """Generate final report in one buffered, atomic write
+
+        Totals are computed once (or taken from `totals`, e.g. the result of
+        calculate_totals_incremental) and the top products are ranked from
+        them. `fmt` is text, csv, jsonl or parquet (needs pyarrow).
+        """
         print("Generating report...")
         start_time = time.time()
-        
-        # PERFORMANCE ISSUE 11: Multiple file writes instead of batching
-        with open('sales_report.txt', 'w') as f:
-            f.write("Sales Report\n")
-            f.write("=" * 50 + "\n\n")
-        
-        totals = self.calculate_totals()
-        top_products = self.find_top_products()
-        
-        # PERFORMANCE ISSUE 12: Writing line by line
-        for product, data in totals.items():
-            with open('sales_report.txt', 'a') as f:
-                f.write(f"Product: {product}\n")
-                f.write(f"Total Sales: ${data['total_sales']:.2f}\n")
-                f.write(f"Average Sales: ${data['avg_sales']:.2f}\n\n")
-        
-        with open('sales_report.txt', 'a') as f:
-            f.write("Top Products:\n")
-            for i, (product, sales) in enumerate(top_products, 1):
-                f.write(f"{i}. {product}: ${sales:.2f}\n")
+
+        if fmt != 'parquet' and fmt not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format '{fmt}', expected one of "
+                             f"{sorted(REPORT_FORMATS) + ['parquet']}")
+        if totals is None:
+            totals = self.calculate_totals()
+        top_products = self.find_top_products(totals=totals)
+
+        if fmt == 'parquet':
+            write_parquet_report(filename, totals, top_products)
+        else:
+            buffer = io.StringIO()
+            REPORT_FORMATS[fmt](totals, top_products, buffer)
+            atomic_write(filename, buffer.getvalue())
         
         report_time = time.time() - start_time
         print(f"Generated report in {report_time:.2f} seconds")
 
+def generate_sales_csv(filename, num_rows, num_products=5, products=None, skew=1.0,
+                       seed=None, batch_size=100_000):
+    """Write a synthetic sales CSV quickly, a batch of rows at a time
+
+    Product popularity follows a Zipf-like distribution (weight 1 / rank ** skew,
+    so skew=0 is uniform). The same seed always produces the same file.
+    """
+    rng = random.Random(seed)
+    if products is None:
+        products = [f"Product {i:06d}" for i in range(1, num_products + 1)]
+    cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(products) + 1)))
+    first_day = date(2024, 1, 1)
+    days = [(first_day + timedelta(days=offset)).isoformat() for offset in range(366)]
+
+    with open(filename, 'w', newline='') as file:
+        file.write("date,product,sales,quantity\n")
+        for start in range(0, num_rows, batch_size):
+            size = min(batch_size, num_rows - start)
+            picked = rng.choices(products, cum_weights=cum_weights, k=size)
+            picked_days = rng.choices(days, k=size)
+            quantities = [int(rng.random() * 50) + 1 for _ in range(size)]
+            file.writelines(f"{day},{product},{quantity * (10 + 90 * rng.random()):.2f},{quantity}\n"
+                            for day, product, quantity in zip(picked_days, picked, quantities))
+
+
 def create_test_csv(filename, num_rows=1000):
     """Create test CSV file with sample data"""
     products = ['Widget A', 'Widget B', 'Widget C', 'Gadget X', 'Gadget Y']
-    
-    with open(filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['date', 'product', 'sales', 'quantity'])
-        
-        for i in range(num_rows):
-            import random
-            date = f"2024-{random.randint(1,12):02d}-{random.randint(1,28):02d}"
-            product = random.choice(products)
-            quantity = random.randint(1, 50)
-            sales = quantity * random.uniform(10, 100)
-            
-            writer.writerow([date, product, f"{sales:.2f}", quantity])
-    
+    generate_sales_csv(filename, num_rows, products=products, skew=0)
     print(f"Created {filename} with {num_rows} rows")
 
 def main():
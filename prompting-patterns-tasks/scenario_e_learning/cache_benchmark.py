@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Cache Benchmarks
+================
+
+Stress tests for the caches in cache_system.py.
+
+    python cache_benchmark.py threads --threads 1 2 4 8 16
+    python cache_benchmark.py trace --synthetic scan --size 1000
+    python cache_benchmark.py trace --file keys.txt --size 5000
+
+The threads benchmark hammers ConcurrentCache.get from a growing number of
+threads and reports total and per-thread throughput. On a regular build the
+GIL caps the total; on a free-threaded build (python3.13t and later) it
+should grow close to linearly with the number of cores.
+
+The trace benchmark replays a key trace (one key per line, or a generated
+one) through SimpleCache with each eviction policy: every key is read and
+put back on a miss. It reports hit ratio and ops/sec per policy.
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+from cache_system import EVICTION_POLICIES, ConcurrentCache, SimpleCache
+
+
+def gil_enabled() -> bool:
+    """False on free-threaded builds running without the GIL"""
+    check = getattr(sys, '_is_gil_enabled', None)
+    return True if check is None else check()
+
+
+def run_thread_benchmark(thread_counts, keys=100_000, ops=200_000, shards=64):
+    """Time `ops` gets per thread for each thread count, return one result per count"""
+    cache = ConcurrentCache(max_size=keys, default_ttl=3600, shards=shards)
+    key_names = [f"key:{i}" for i in range(keys)]
+    results = []
+
+    for key in key_names:
+        cache.put(key, key)
+
+    for count in thread_counts:
+        barrier = threading.Barrier(count + 1)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            sample = [key_names[rng.randrange(keys)] for _ in range(ops)]
+            barrier.wait()
+            get = cache.get
+            for key in sample:
+                get(key)
+            barrier.wait()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        barrier.wait()
+        elapsed = time.perf_counter() - started
+        for thread in threads:
+            thread.join()
+
+        total = count * ops / elapsed
+        results.append({'threads': count, 'seconds': elapsed,
+                        'ops_per_sec': total, 'ops_per_sec_per_thread': total / count})
+    return results
+
+
+def synthetic_trace(kind, length=200_000, hot_keys=1_000, seed=0):
+    """Generate a key trace
+
+    zipf: skewed reads over a hot set
+    scan: the zipf workload interrupted by long one-off scans of cold keys
+    loop: a cyclic scan slightly larger than typical cache sizes
+    """
+    rng = random.Random(seed)
+    if kind == 'loop':
+        return [f"loop:{i % (hot_keys * 2)}" for i in range(length)]
+    weights = [1 / rank for rank in range(1, hot_keys + 1)]
+    hot = rng.choices(range(hot_keys), weights=weights, k=length)
+    if kind == 'zipf':
+        return [f"hot:{key}" for key in hot]
+    if kind == 'scan':
+        trace = []
+        cold = 0
+        for start in range(0, length, 10 * hot_keys):
+            trace.extend(f"hot:{key}" for key in hot[start:start + 10 * hot_keys])
+            scan = 2 * hot_keys
+            trace.extend(f"cold:{cold + i}" for i in range(scan))
+            cold += scan
+        return trace[:length]
+    raise ValueError(f"Unknown synthetic trace '{kind}'")
+
+
+def replay_trace(trace, size, policies=None):
+    """Replay a trace through each policy, return one result per policy"""
+    results = []
+    for policy in policies or EVICTION_POLICIES:
+        cache = SimpleCache(max_size=size, default_ttl=10 ** 9, eviction=policy)
+        hits = 0
+        started = time.perf_counter()
+        for key in trace:
+            if cache.get(key) is None:
+                cache.put(key, True)
+            else:
+                hits += 1
+        elapsed = time.perf_counter() - started
+        results.append({'policy': policy, 'hit_ratio': hits / len(trace),
+                        'ops_per_sec': len(trace) / elapsed})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    threads = commands.add_parser('threads', help="concurrent get throughput vs thread count")
+    threads.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    threads.add_argument('--keys', type=int, default=100_000)
+    threads.add_argument('--ops', type=int, default=200_000, help="gets per thread")
+    threads.add_argument('--shards', type=int, default=64)
+
+    trace = commands.add_parser('trace', help="hit ratio and speed per eviction policy")
+    source = trace.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help="recorded trace, one key per line")
+    source.add_argument('--synthetic', choices=['zipf', 'scan', 'loop'])
+    trace.add_argument('--length', type=int, default=200_000, help="synthetic trace length")
+    trace.add_argument('--size', type=int, default=500, help="cache max_size")
+    trace.add_argument('--policies', nargs='+', choices=sorted(EVICTION_POLICIES))
+
+    args = parser.parse_args()
+
+    if args.command == 'threads':
+        print(f"GIL enabled: {gil_enabled()}, CPUs: {os.cpu_count()}")
+        results = run_thread_benchmark(args.threads, args.keys, args.ops, args.shards)
+        base = results[0]['ops_per_sec'] / results[0]['threads']
+        for result in results:
+            print(f"{result['threads']:>3} threads: {result['ops_per_sec']:>12,.0f} gets/sec "
+                  f"({result['ops_per_sec_per_thread']:,.0f} per thread, "
+                  f"{result['ops_per_sec'] / base:.2f}x one thread)")
+    elif args.command == 'trace':
+        if args.file:
+            with open(args.file) as f:
+                keys = [line.strip() for line in f if line.strip()]
+        else:
+            keys = synthetic_trace(args.synthetic, args.length)
+        print(f"Replaying {len(keys):,} accesses with cache size {args.size}")
+        for result in replay_trace(keys, args.size, args.policies):
+            print(f"{result['policy']:>10}: hit ratio {result['hit_ratio']:6.2%}, "
+                  f"{result['ops_per_sec']:>10,.0f} ops/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Cache Server
+============
+
+Serves one SimpleCache to every process on the host, so worker processes
+share a single hot cache instead of each keeping (and missing) their own.
+
+    python cache_server.py --max-size 100000
+    CACHE_SERVER_SECRET=... python cache_server.py --port 7379
+
+    client = CacheClient()
+    client.put('user:42', {'name': 'Alice'})
+    client.get('user:42')
+
+The server is asyncio based and handles every request on one thread, so
+the cache needs no locks. Requests and responses are length-prefixed,
+HMAC-signed pickled tuples:
+
+    request:  <uint32 length> <HMAC-SHA256> pickle((command, args))
+    response: <uint32 length> <HMAC-SHA256> pickle((ok, result or exception))
+
+Responses come back in request order, which lets a client pipeline many
+requests on one connection and read the replies afterwards.
+
+Pickle can run code while loading, so a frame is only unpickled once its
+signature checks out. By default the server listens on a Unix socket that
+only its own user can open (mode 0600), in a directory only that user can
+enter (mode 0700), and frames are signed with an empty key. Clients refuse
+a Unix socket owned by another user. TCP needs a shared secret and only
+listens on loopback addresses.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import ipaddress
+import os
+import pickle
+import queue
+import socket
+import stat
+import struct
+import tempfile
+from typing import Any, Iterable, Mapping, Optional, Union
+
+from cache_system import SimpleCache
+
+DEFAULT_PORT = 7379
+_FRAME_LENGTH = struct.Struct('<I')
+_DIGEST_SIZE = hashlib.sha256().digest_size
+MAX_FRAME_SIZE = 64 << 20
+SECRET_ENV = 'CACHE_SERVER_SECRET'
+
+# Cache methods clients may call
+COMMANDS = frozenset({
+    'put', 'get', 'delete', 'clear', 'stats',
+    'get_many', 'put_many', 'delete_many', 'delete_prefix', 'delete_pattern',
+})
+
+
+def default_socket_path() -> str:
+    """
+    Per-user Unix socket path used when no path or port is given
+
+    The socket goes in $XDG_RUNTIME_DIR, or else in a cache-server-<uid>
+    directory under the shared temp dir, which the server creates with
+    mode 0700 so no other user can put a socket there first.
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), f"cache-server-{os.getuid()}")
+    return os.path.join(directory, 'cache-server.sock')
+
+
+def _make_private_dir(directory: str) -> None:
+    """Create directory with mode 0700, or check that the existing one is ours and private"""
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(directory, 0o700)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} must be a directory that only this user can access")
+
+
+def _check_socket_owner(path: str) -> None:
+    """Refuse a Unix socket that another user created (it could answer with any pickle)"""
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f"{path} belongs to another user; refusing to connect")
+
+
+def _secret_bytes(secret: Union[str, bytes, None]) -> bytes:
+    if secret is None:
+        secret = os.environ.get(SECRET_ENV, '')
+    return secret.encode() if isinstance(secret, str) else secret
+
+
+def _check_loopback(host: str) -> None:
+    if host == 'localhost':
+        return
+    try:
+        loopback = ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise ValueError(f"Refusing to listen on {host}: pickled frames are only safe on loopback")
+
+
+def _frame(message: Any, secret: bytes) -> bytes:
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    if len(data) > MAX_FRAME_SIZE:
+        raise ValueError(f"Message of {len(data)} bytes is over the {MAX_FRAME_SIZE} byte limit")
+    digest = hmac.new(secret, data, hashlib.sha256).digest()
+    return _FRAME_LENGTH.pack(len(data)) + digest + data
+
+
+def _unframe(digest: bytes, data: bytes, secret: bytes) -> Any:
+    """Unpickle a frame's payload, but only if it was signed with secret"""
+    if not hmac.compare_digest(digest, hmac.new(secret, data, hashlib.sha256).digest()):
+        raise ConnectionError("Frame signature does not match; wrong secret?")
+    return pickle.loads(data)
+
+
+class CacheServer:
+    """Hosts a SimpleCache-compatible store on a Unix socket or localhost TCP port"""
+
+    def __init__(self, cache: Optional[Any] = None, path: Optional[str] = None,
+                 host: str = '127.0.0.1', port: Optional[int] = None,
+                 secret: Union[str, bytes, None] = None):
+        """
+        Initialize the server
+
+        Args:
+            cache: Store to serve (defaults to a new SimpleCache)
+            path: Unix socket path (default: default_socket_path()); ignored when port is set
+            host: TCP address to listen on; must be a loopback address
+            port: Serve on this TCP port instead of a Unix socket (0 picks a free one, see address)
+            secret: Key that signs every frame (default: $CACHE_SERVER_SECRET); required for TCP
+        """
+        self.secret = _secret_bytes(secret)
+        if port is not None:
+            _check_loopback(host)
+            if not self.secret:
+                raise ValueError(f"Serving over TCP needs a secret (set {SECRET_ENV})")
+            path = None
+        elif path is None:
+            path = default_socket_path()
+            _make_private_dir(os.path.dirname(path))
+        self.cache = cache if cache is not None else SimpleCache()
+        self.path = path
+        self.host = host
+        self.port = port
+        self.clients = 0
+        self.requests = 0
+        self._server = None
+
+    @property
+    def address(self) -> Union[str, tuple]:
+        """Socket path or (host, port) the server is listening on"""
+        if self.path is not None:
+            return self.path
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self) -> None:
+        """Start listening (connections are handled on the running event loop)"""
+        if self.path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+            # Create the socket owner-only from the start, not chmod it afterwards
+            umask = os.umask(0o177)
+            try:
+                self._server = await asyncio.start_unix_server(self._handle, self.path)
+            finally:
+                os.umask(umask)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        if self.path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+    def execute(self, command: str, args: tuple) -> Any:
+        """Run one command against the cache"""
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command '{command}'")
+        self.requests += 1
+        if command == 'stats':
+            stats = self.cache.stats()
+            stats['clients'] = self.clients
+            stats['requests'] = self.requests
+            return stats
+        return getattr(self.cache, command)(*args)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_FRAME_LENGTH.size)
+                except asyncio.IncompleteReadError:
+                    break
+                (length,) = _FRAME_LENGTH.unpack(header)
+                if length > MAX_FRAME_SIZE:
+                    break
+                digest = await reader.readexactly(_DIGEST_SIZE)
+                data = await reader.readexactly(length)
+                # Raises ConnectionError (dropping the client) for unsigned frames
+                request = _unframe(digest, data, self.secret)
+                try:
+                    command, args = request
+                    response = (True, self.execute(command, args))
+                except Exception as error:
+                    response = (False, error)
+                try:
+                    writer.write(_frame(response, self.secret))
+                except Exception as error:
+                    # The result itself could not be pickled or is too big
+                    writer.write(_frame((False, ValueError(f"Cannot send result: {error}")),
+                                        self.secret))
+                # Returns at once unless the client stopped reading
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+
+class Pipeline:
+    """Queues client calls and sends them in one write (see CacheClient.pipeline)"""
+
+    def __init__(self, client: 'CacheClient'):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, command: str):
+        if command not in COMMANDS:
+            raise AttributeError(command)
+
+        def queue_call(*args):
+            self._calls.append((command, args))
+            return self
+
+        return queue_call
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def execute(self) -> list:
+        """Send every queued call and return their results in order"""
+        calls, self._calls = self._calls, []
+        return self._client._execute(calls)
+
+
+class CacheClient:
+    """Talks to a CacheServer with the same put/get/delete/clear/stats API as SimpleCache
+
+    Safe to share between threads: every call borrows a connection from a
+    small pool (opening one if none is idle) and returns it afterwards.
+    """
+
+    def __init__(self, path: Optional[str] = None, host: str = '127.0.0.1',
+                 port: Optional[int] = None, pool_size: int = 4, timeout: Optional[float] = 5.0,
+                 secret: Union[str, bytes, None] = None):
+        """
+        Initialize the client (connections are opened on first use)
+
+        Args:
+            path: Unix socket path of the server (default: default_socket_path());
+                  ignored when port is set
+            host: Server address
+            port: Connect to this TCP port instead of a Unix socket
+            pool_size: Idle connections kept open for reuse
+            timeout: Socket timeout in seconds (None waits forever)
+            secret: The server's frame signing key (default: $CACHE_SERVER_SECRET)
+        """
+        if port is None and path is None:
+            path = default_socket_path()
+        self.path = None if port is not None else path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.secret = _secret_bytes(secret)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> socket.socket:
+        if self.path is not None:
+            _check_socket_owner(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.path
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            address = (self.host, self.port)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Borrow a pooled connection; one that failed mid-request is closed, not reused"""
+        try:
+            sock = self._pool.get_nowait()
+        except queue.Empty:
+            sock = self._connect()
+        try:
+            yield sock
+        except BaseException:
+            sock.close()
+            raise
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    @staticmethod
+    def _read_exactly(sock: socket.socket, size: int) -> bytes:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = sock.recv_into(view[received:])
+            if not count:
+                raise ConnectionError("Cache server closed the connection")
+            received += count
+        return bytes(buffer)
+
+    def _execute(self, calls: list) -> list:
+        """Send calls in one write, read every reply, then raise the first error if any"""
+        if not calls:
+            return []
+        payload = b''.join(_frame(call, self.secret) for call in calls)
+        results = []
+        error = None
+        with self._connection() as sock:
+            sock.sendall(payload)
+            for _ in calls:
+                (length,) = _FRAME_LENGTH.unpack(self._read_exactly(sock, _FRAME_LENGTH.size))
+                digest = self._read_exactly(sock, _DIGEST_SIZE)
+                ok, result = _unframe(digest, self._read_exactly(sock, length), self.secret)
+                if not ok and error is None:
+                    error = result
+                results.append(result)
+        if error is not None:
+            raise error
+        return results
+
+    def _call(self, command: str, *args) -> Any:
+        return self._execute([(command, args)])[0]
+
+    def pipeline(self) -> Pipeline:
+        """
+        Batch calls into one round trip
+
+            results = client.pipeline().put('a', 1).put('b', 2).get('a').execute()
+        """
+        return Pipeline(self)
+
+    def put(self, key: str, value: Any, ttl: Optional[int] = None, cost: float = 1.0) -> None:
+        """Store a value in the cache (see SimpleCache.put)"""
+        self._call('put', key, value, ttl, cost)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Retrieve a value from the cache (see SimpleCache.get)"""
+        return self._call('get', key)
+
+    def delete(self, key: str) -> bool:
+        """Remove an item from the cache (see SimpleCache.delete)"""
+        return self._call('delete', key)
+
+    def clear(self) -> None:
+        """Remove all items from the cache"""
+        self._call('clear')
+
+    def stats(self) -> dict:
+        """Cache statistics plus the server's client and request counts"""
+        return self._call('stats')
+
+    def get_many(self, keys: Iterable[str]) -> dict:
+        """Retrieve several values in one request (see SimpleCache.get_many)"""
+        return self._call('get_many', list(keys))
+
+    def put_many(self, items: Union[Mapping[str, Any], Iterable[tuple]],
+                 ttl: Optional[int] = None, cost: float = 1.0) -> None:
+        """Store several values in one request (see SimpleCache.put_many)"""
+        if isinstance(items, Mapping):
+            items = items.items()
+        self._call('put_many', list(items), ttl, cost)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Remove several items in one request (see SimpleCache.delete_many)"""
+        return self._call('delete_many', list(keys))
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Remove every key starting with prefix (see SimpleCache.delete_prefix)"""
+        return self._call('delete_prefix', prefix)
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Remove every key matching a glob pattern (see SimpleCache.delete_pattern)"""
+        return self._call('delete_pattern', pattern)
+
+    def close(self) -> None:
+        """Close the idle pooled connections"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self) -> 'CacheClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared SimpleCache server")
+    parser.add_argument('--socket', help=f"Unix socket path (default: {default_socket_path()})")
+    parser.add_argument('--host', default='127.0.0.1', help="loopback address for --port")
+    parser.add_argument('--port', type=int, nargs='?', const=DEFAULT_PORT,
+                        help=f"serve over TCP instead (default port {DEFAULT_PORT}, "
+                             f"needs ${SECRET_ENV})")
+    parser.add_argument('--max-size', type=int, default=10_000)
+    parser.add_argument('--ttl', type=int, default=300, help="default TTL in seconds")
+    parser.add_argument('--max-bytes', type=int)
+    parser.add_argument('--eviction', default='lru')
+    args = parser.parse_args()
+
+    cache = SimpleCache(args.max_size, args.ttl, args.max_bytes, eviction=args.eviction)
+    try:
+        server = CacheServer(cache, args.socket, args.host, args.port)
+    except (ValueError, PermissionError) as error:
+        parser.error(str(error))
+
+    async def run():
+        await server.start()
+        print(f"Serving cache on {server.address}")
+        await server.serve_forever()
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -9,27 +9,842 @@ Perfect for learning about classes, methods, and data structures.
 Practice Challenge: Use the "Learning" prompt pattern to understand how it works
 """
 
+import asyncio
+import atexit
+import bisect
+import contextlib
+import fnmatch
+import functools
+import gc
+import heapq
+import http.server
+import inspect
+import itertools
+import logging
+import os
+import pickle
+import random
+import stat
+import struct
+import sys
+import tempfile
+import threading
 import time
-from typing import Any, Optional
+import types
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, ContextManager, Iterable, Mapping, Optional, Union
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_names(cls: type) -> tuple:
+    """Every __slots__ attribute name declared by cls and its bases"""
+    names = []
+    for klass in cls.__mro__:
+        slots = klass.__dict__.get('__slots__', ())
+        names.extend((slots,) if isinstance(slots, str) else slots)
+    return tuple(name for name in names if name not in ('__dict__', '__weakref__'))
+
+
+def deep_sizeof(value: Any) -> int:
+    """sys.getsizeof of a value plus everything it contains (each object counted once)
+
+    Instance attributes are followed through both __dict__ and __slots__.
+    Modules and classes are shared rather than contained, so they are
+    neither counted nor followed.
+    """
+    seen = set()
+    stack = [value]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(vars(obj))
+            for name in _slot_names(type(obj)):
+                try:
+                    stack.append(getattr(obj, name))
+                except AttributeError:
+                    pass  # Slot never assigned
+    return total
+
+
+# Built-in ways to measure an entry for the byte budget
+SIZERS = {
+    'deep': deep_sizeof,
+    'len': len,
+}
+
+
+class _Entry:
+    """One cached value with its timestamps (slots keep per-key overhead small)"""
+    __slots__ = ('value', 'created', 'expires', 'last_accessed', 'size', 'cost', 'priority')
+
+    def __init__(self, value: Any, created: float, expires: float, size: int = 0, cost: float = 1.0):
+        self.value = value
+        self.created = created
+        self.expires = expires
+        self.last_accessed = created
+        self.size = size
+        self.cost = cost
+        self.priority = 0.0
+
+
+# Snapshot file: header (magic, values-compressed flag, time written), then
+# batches of records in LRU order, ending with a zero length. Each batch is
+# a length-prefixed pickle of (keys, remaining ttls, sizes, costs) columns
+# followed by a length-prefixed pickle of the values, so a lazy restore can
+# index the keys without unpickling any values.
+SNAPSHOT_MAGIC = b'SCSNAP02'
+# Version 1 pickled each batch as one list of (key, ttl, size, cost, value)
+_SNAPSHOT_MAGIC_V1 = b'SCSNAP01'
+_SNAPSHOT_HEADER = struct.Struct('<8s?d')
+_BATCH_LENGTH = struct.Struct('<I')
+SNAPSHOT_BATCH_SIZE = 10_000
+
+
+def _read_snapshot_batches(f, magic: bytes):
+    """Yield (keys, remaining ttls, sizes, costs, values) per snapshot batch
+
+    values is still pickled (bytes) for version 2 files and a list for version 1.
+    """
+    while True:
+        (length,) = _BATCH_LENGTH.unpack(f.read(_BATCH_LENGTH.size))
+        if not length:
+            return
+        if magic == _SNAPSHOT_MAGIC_V1:
+            records = pickle.loads(f.read(length))
+            yield tuple(list(column) for column in zip(*records)) if records else ([],) * 5
+            continue
+        keys, remaining, sizes, costs = pickle.loads(f.read(length))
+        (length,) = _BATCH_LENGTH.unpack(f.read(_BATCH_LENGTH.size))
+        yield keys, remaining, sizes, costs, f.read(length)
+
+
+class _PendingBatch:
+    """One lazily restored snapshot batch; its values are unpickled on first use"""
+    __slots__ = ('start', 'expires_base', 'remaining', 'sizes', 'costs', 'values', 'compressed')
+
+    def __init__(self, start: int, expires_base: float, remaining, sizes, costs,
+                 values: Union[bytes, list], compressed: bool):
+        self.start = start
+        self.expires_base = expires_base
+        self.remaining = remaining
+        self.sizes = sizes
+        self.costs = costs
+        self.values = values
+        self.compressed = compressed
+
+    def record(self, index: int) -> tuple:
+        """(expires, size, cost, value) of the batch's index-th record"""
+        if isinstance(self.values, bytes):
+            self.values = pickle.loads(self.values)
+        return (self.expires_base + self.remaining[index], self.sizes[index],
+                self.costs[index], self.values[index])
+
+    def take(self, index: int) -> tuple:
+        """record(index), dropping the batch's reference to the value"""
+        record = self.record(index)
+        self.values[index] = None
+        return record
+
+
+@contextlib.contextmanager
+def _atomic_file(path: str, mode: str = 'w'):
+    """
+    Yield a temp file next to path that replaces path once the block succeeds
+    
+    The file is fsynced before the rename and keeps path's permissions (or
+    gets the umask's for a new file); if the block fails it is removed.
+    """
+    try:
+        permissions = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        permissions = 0o666 & ~umask
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(mode, dir=directory, delete=False, suffix='.tmp') as temp:
+        try:
+            yield temp
+            temp.flush()
+            os.chmod(temp.name, permissions)
+            os.fsync(temp.fileno())
+        except BaseException:
+            temp.close()
+            os.unlink(temp.name)
+            raise
+    os.replace(temp.name, path)
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Pause the cyclic GC while creating millions of objects (it would rescan them repeatedly)"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class EvictionPolicy:
+    """Decides which key SimpleCache evicts when it is over max_size or max_bytes
+
+    The cache inserts first and then asks for victims until it fits again,
+    so a policy can also refuse a new key by returning it (admission).
+    Subclasses override the hooks they need; the defaults do nothing.
+    """
+    name = 'policy'
+
+    def __init__(self, cache: 'SimpleCache'):
+        self.cache = cache
+
+    def on_insert(self, key: str, entry: _Entry) -> None:
+        pass
+
+    def on_access(self, key: str, entry: _Entry) -> None:
+        pass
+
+    def on_update(self, key: str, old: _Entry, entry: _Entry) -> None:
+        """A cached key was overwritten; by default that counts as an access"""
+        self.on_access(key, entry)
+
+    def on_miss(self, key: str) -> None:
+        pass
+
+    def on_remove(self, key: str, entry: _Entry, evicted: bool) -> None:
+        pass
+
+    def victim(self, incoming: str) -> Optional[str]:
+        """Return the key to evict next (incoming is the key just inserted)"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        pass
+
+
+class LRUPolicy(EvictionPolicy):
+    """Least recently used, using the cache's own OrderedDict as the recency list"""
+    name = 'LRU'
+
+    def on_access(self, key, entry):
+        self.cache._data.move_to_end(key)
+
+    def victim(self, incoming):
+        for key in self.cache._data:
+            if key != incoming:
+                return key
+        return None
+
+
+class LFUPolicy(EvictionPolicy):
+    """Least frequently used in O(1): keys bucketed by access count, LRU within a bucket"""
+    name = 'LFU'
+
+    def __init__(self, cache):
+        super().__init__(cache)
+        self._counts = {}
+        self._buckets = {}  # count -> OrderedDict of keys
+        self._min_count = 0
+
+    def _bucket(self, count):
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = OrderedDict()
+        return bucket
+
+    def _unlink(self, key):
+        count = self._counts.pop(key)
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+        return count
+
+    def on_insert(self, key, entry):
+        self._counts[key] = 1
+        self._bucket(1)[key] = None
+        self._min_count = 1
+
+    def on_access(self, key, entry):
+        count = self._unlink(key)
+        if self._min_count == count and count not in self._buckets:
+            self._min_count = count + 1
+        self._counts[key] = count + 1
+        self._bucket(count + 1)[key] = None
+
+    def on_remove(self, key, entry, evicted):
+        if key in self._counts:
+            self._unlink(key)
+
+    def victim(self, incoming):
+        bucket = self._buckets.get(self._min_count, ())
+        for key in bucket:
+            if key != incoming:
+                return key
+        # Only the new key has the lowest count; look further up
+        for count in sorted(self._buckets):
+            for key in self._buckets[count]:
+                if key != incoming:
+                    return key
+        return None
+
+    def clear(self):
+        self._counts.clear()
+        self._buckets.clear()
+        self._min_count = 0
+
+
+class ARCPolicy(EvictionPolicy):
+    """Adaptive Replacement Cache
+
+    T1 holds keys seen once recently, T2 keys seen at least twice. Ghost
+    lists B1/B2 remember recently evicted keys and shift the target size p
+    of T1, so a one-off scan cannot push out the frequently used keys in T2.
+    """
+    name = 'ARC'
+
+    def __init__(self, cache):
+        super().__init__(cache)
+        self._t1 = OrderedDict()
+        self._t2 = OrderedDict()
+        self._b1 = OrderedDict()
+        self._b2 = OrderedDict()
+        self._p = 0.0
+
+    def on_insert(self, key, entry):
+        capacity = self.cache.max_size
+        if key in self._b1:
+            self._p = min(capacity, self._p + max(len(self._b2) / len(self._b1), 1))
+            del self._b1[key]
+            self._t2[key] = None
+        elif key in self._b2:
+            self._p = max(0.0, self._p - max(len(self._b1) / len(self._b2), 1))
+            del self._b2[key]
+            self._t2[key] = None
+        else:
+            self._t1[key] = None
+        # Keep |T1| + |B1| <= c and the whole directory <= 2c
+        while self._b1 and len(self._t1) + len(self._b1) > capacity:
+            self._b1.popitem(last=False)
+        while len(self._t1) + len(self._t2) + len(self._b1) + len(self._b2) > 2 * capacity:
+            ghosts = self._b2 or self._b1
+            if not ghosts:
+                break
+            ghosts.popitem(last=False)
+
+    def on_access(self, key, entry):
+        if key in self._t1:
+            del self._t1[key]
+            self._t2[key] = None
+        else:
+            self._t2.move_to_end(key)
+
+    def on_remove(self, key, entry, evicted):
+        if key in self._t1:
+            del self._t1[key]
+            if evicted:
+                self._b1[key] = None
+        elif key in self._t2:
+            del self._t2[key]
+            if evicted:
+                self._b2[key] = None
+
+    def victim(self, incoming):
+        t1_keys = [key for key in itertools.islice(self._t1, 2) if key != incoming]
+        t1_size = len(self._t1) - (incoming in self._t1)
+        if t1_keys and (t1_size > self._p or not self._t2):
+            return t1_keys[0]
+        for key in self._t2:
+            if key != incoming:
+                return key
+        return t1_keys[0] if t1_keys else None
+
+    def clear(self):
+        for keys in (self._t1, self._t2, self._b1, self._b2):
+            keys.clear()
+        self._p = 0.0
+
+
+class FrequencySketch:
+    """Count-Min sketch of 4-bit counters with periodic halving (TinyLFU)
+
+    Estimates how often a key was seen recently in a fixed amount of memory.
+    After sample_size increments every counter is halved, so old popularity
+    fades away.
+    """
+
+    _SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5)
+    _HALVE = bytes(count >> 1 for count in range(256))
+
+    def __init__(self, capacity: int):
+        width = 16
+        while width < capacity:
+            width *= 2
+        self._shift = 64 - (width.bit_length() - 1)
+        self._table = [bytearray(width) for _ in self._SEEDS]
+        self.sample_size = 10 * max(capacity, 1)
+        self._additions = 0
+
+    def _cells(self, key):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return [((h * seed) & 0xFFFFFFFFFFFFFFFF) >> self._shift for seed in self._SEEDS]
+
+    def increment(self, key) -> None:
+        for row, cell in zip(self._table, self._cells(key)):
+            if row[cell] < 15:
+                row[cell] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self._additions //= 2
+            for row in self._table:
+                row[:] = row.translate(self._HALVE)
+
+    def frequency(self, key) -> int:
+        return min(row[cell] for row, cell in zip(self._table, self._cells(key)))
+
+    def clear(self) -> None:
+        for row in self._table:
+            row[:] = bytes(len(row))
+        self._additions = 0
+
+
+class WTinyLFUPolicy(EvictionPolicy):
+    """Window TinyLFU: a small LRU window in front of a frequency-filtered main area
+
+    New keys enter a window of about 1% of the cache. Keys pushed out of the
+    window join the probation segment of the main (segmented LRU) area, and
+    when the cache is full the newest of them only stays if the frequency
+    sketch says it is more popular than probation's oldest key. Scans of cold keys therefore pass
+    through the window without displacing the hot working set.
+    """
+    name = 'W-TinyLFU'
+
+    def __init__(self, cache):
+        super().__init__(cache)
+        capacity = cache.max_size
+        self._window_size = max(1, capacity // 100)
+        self._protected_size = max(1, int((capacity - self._window_size) * 0.8))
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self.sketch = FrequencySketch(capacity)
+
+    def on_insert(self, key, entry):
+        self.sketch.increment(key)
+        self._window[key] = None
+        # Keys leaving the window become candidates at the MRU end of probation
+        while len(self._window) > self._window_size:
+            candidate, _ = self._window.popitem(last=False)
+            self._probation[candidate] = None
+
+    def on_access(self, key, entry):
+        self.sketch.increment(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            if len(self._protected) > self._protected_size:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+        else:
+            self._protected.move_to_end(key)
+
+    def on_miss(self, key):
+        self.sketch.increment(key)
+
+    def on_remove(self, key, entry, evicted):
+        for segment in (self._window, self._probation, self._protected):
+            if key in segment:
+                del segment[key]
+                return
+
+    def victim(self, incoming):
+        if len(self._probation) > 1:
+            victim = next(iter(self._probation))
+            candidate = next(reversed(self._probation))
+            # Admission: the newest candidate only stays if it is more popular
+            if self.sketch.frequency(candidate) > self.sketch.frequency(victim):
+                return victim
+            return candidate
+        for segment in (self._probation, self._protected, self._window):
+            if segment:
+                return next(iter(segment))
+        return None
+
+    def clear(self):
+        for segment in (self._window, self._probation, self._protected):
+            segment.clear()
+        self.sketch.clear()
+
+
+class GreedyDualSizePolicy(EvictionPolicy):
+    """GreedyDual-Size: keeps small entries that are expensive to recompute longer
+
+    Priority is L + cost / size, refreshed on access; the lowest goes first
+    and L rises to the evicted priority, so untouched entries age out.
+    """
+    name = 'GDS'
+
+    def __init__(self, cache):
+        super().__init__(cache)
+        self._heap = []  # (priority, key), stale entries skipped
+        self._inflation = 0.0
+
+    def _reprioritize(self, key, entry):
+        entry.priority = self._inflation + entry.cost / max(entry.size, 1)
+        heapq.heappush(self._heap, (entry.priority, key))
+        if len(self._heap) > 2 * len(self.cache._data) + 64:
+            self._heap = [(e.priority, k) for k, e in self.cache._data.items()]
+            heapq.heapify(self._heap)
+
+    on_insert = _reprioritize
+    on_access = _reprioritize
+
+    def victim(self, incoming):
+        heap = self._heap
+        skipped = None
+        while heap:
+            priority, key = heap[0]
+            entry = self.cache._data.get(key)
+            if entry is None or entry.priority != priority:
+                heapq.heappop(heap)
+                continue
+            if key == incoming:
+                skipped = heapq.heappop(heap)
+                continue
+            # Everything left ages relative to the evicted priority
+            self._inflation = priority
+            break
+        else:
+            key = None
+        if skipped is not None:
+            heapq.heappush(heap, skipped)
+        return key
+
+    def clear(self):
+        self._heap.clear()
+        self._inflation = 0.0
+
+
+EVICTION_POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'arc': ARCPolicy,
+    'w-tinylfu': WTinyLFUPolicy,
+    'gds': GreedyDualSizePolicy,
+}
+
+
+# Latency histogram bucket bounds in seconds: 1us to 1s, four per decade
+LATENCY_BUCKETS = tuple(10.0 ** (exponent / 4) for exponent in range(-24, 1))
+
+# Events that are counted, and the stats() key each one is counted under
+COUNTED_EVENTS = {
+    'hit': 'hits',
+    'miss': 'misses',
+    'expire': 'expirations',
+    'evict': 'evictions',
+    'put': 'puts',
+    'delete': 'deletes',
+    'reject': 'rejections',
+}
+
+
+class LatencyHistogram:
+    """Counts of observed durations per LATENCY_BUCKETS bucket (the last one is overflow)"""
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (inf if it overflowed)"""
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float('inf')
+        return 0.0
+
+
+class CacheMetrics:
+    """Event counters and get/put/delete latency histograms for one cache"""
+
+    OPERATIONS = ('get', 'put', 'delete', 'get_many', 'put_many', 'delete_many')
+
+    def __init__(self):
+        self.counts = dict.fromkeys(COUNTED_EVENTS.values(), 0)
+        self.latency = {op: LatencyHistogram() for op in self.OPERATIONS}
+
+    def count(self, event: str) -> None:
+        name = COUNTED_EVENTS.get(event)
+        if name is not None:
+            self.counts[name] += 1
+
+    def merge(self, other: 'CacheMetrics') -> None:
+        for name, count in other.counts.items():
+            self.counts[name] += count
+        for op, histogram in other.latency.items():
+            self.latency[op].merge(histogram)
+
+
+def format_event(event: str, key: Optional[str], info: dict) -> Optional[str]:
+    """Describe a cache event in words (None for events that are not worth a line)"""
+    if event == 'put':
+        return f"Cached '{key}' (expires in {info['ttl']}s)"
+    if event == 'hit':
+        return f"Cache hit: '{key}'"
+    if event == 'miss':
+        if info['reason'] == 'expired':
+            return f"Cache miss: '{key}' has expired"
+        return f"Cache miss: '{key}' not found"
+    if event == 'expire':
+        # Expiry found by get is already reported as a miss
+        return f"Auto-removed expired key: '{key}'" if info['reason'] == 'cleanup' else None
+    if event == 'evict':
+        return f"Evicted {info['policy']} key: '{key}'"
+    if event == 'reject':
+        if info['reason'] == 'too large':
+            return (f"Not caching '{key}': {info['size']} bytes is over the "
+                    f"{info['max_bytes']} byte budget")
+        return f"Not admitted: '{key}' ({info['policy']} kept the existing keys)"
+    if event == 'delete':
+        if info['found']:
+            return f"Deleted '{key}' from cache"
+        return f"Cannot delete '{key}': not found in cache"
+    if event == 'clear':
+        return "Cache cleared"
+    if event == 'restore':
+        return f"Restored {info['restored']} entries from {info['path']} ({info['skipped']} expired)"
+    if event == 'error':
+        target = f" to {info['path']}" if 'path' in info else ''
+        return f"{info['action']}{target} failed: {info['error']}"
+    return None
+
+
+def print_listener(event: str, key: Optional[str], info: dict) -> None:
+    """Listener that prints every event (what SimpleCache used to do unconditionally)"""
+    message = format_event(event, key, info)
+    if message is not None:
+        print(message)
+
+
+def logging_listener(logger: Optional[logging.Logger] = None,
+                     level: int = logging.DEBUG) -> Callable[[str, Optional[str], dict], None]:
+    """
+    Make a listener that logs every event
+    
+    Args:
+        logger: Logger to write to (defaults to this module's logger)
+        level: Level for normal events; 'error' events are logged at ERROR
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+
+    def listener(event, key, info):
+        event_level = logging.ERROR if event == 'error' else level
+        if logger.isEnabledFor(event_level):
+            message = format_event(event, key, info)
+            if message is not None:
+                logger.log(event_level, message)
+
+    return listener
+
+
+def prometheus_text(cache, prefix: str = 'cache') -> str:
+    """
+    Render a cache's stats in the Prometheus text exposition format
+    
+    Counters and latency histograms are included when the cache was created
+    with metrics=True; item and byte gauges always are.
+    """
+    stats = cache.stats()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{prefix}_{name}{suffix}{labels} {value}")
+
+    metric('items', 'gauge', 'Entries currently cached.', [('', '', stats['total_items'])])
+    metric('max_items', 'gauge', 'Entry limit.', [('', '', stats['max_size'])])
+    metric('bytes', 'gauge', 'Bytes used by cached values.', [('', '', stats['bytes_used'])])
+    if stats['max_bytes'] is not None:
+        metric('max_bytes', 'gauge', 'Byte budget.', [('', '', stats['max_bytes'])])
+
+    metrics = cache.metrics
+    if metrics is not None:
+        for name, count in metrics.counts.items():
+            metric(f"{name}_total", 'counter', f"Cache {name} since start.", [('', '', count)])
+        samples = []
+        for op, histogram in metrics.latency.items():
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                samples.append(('_bucket', f'{{op="{op}",le="{bound:.6g}"}}', cumulative))
+            samples.append(('_bucket', f'{{op="{op}",le="+Inf"}}', histogram.count))
+            samples.append(('_sum', f'{{op="{op}"}}', repr(histogram.total)))
+            samples.append(('_count', f'{{op="{op}"}}', histogram.count))
+        metric('operation_seconds', 'histogram', 'Latency of cache operations.', samples)
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(cache, path: str, prefix: str = 'cache') -> None:
+    """Atomically write prometheus_text to a file (e.g. for node_exporter's textfile collector)"""
+    text = prometheus_text(cache, prefix)
+    with _atomic_file(path) as f:
+        f.write(text)
+
+
+def serve_prometheus(cache, port: int = 9100, host: str = '127.0.0.1',
+                     prefix: str = 'cache') -> http.server.ThreadingHTTPServer:
+    """
+    Serve prometheus_text on http://host:port/metrics from a daemon thread
+    
+    Scrapes run on the server thread, so a SimpleCache that is also used from
+    other threads should be wrapped in a ConcurrentCache.
+    
+    Returns:
+        The running server; call shutdown() on it to stop serving
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text(cache, prefix).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='cache-metrics', daemon=True).start()
+    return server
+
 
 class SimpleCache:
     """A basic cache implementation with size limits and expiration"""
     
-    def __init__(self, max_size: int = 100, default_ttl: int = 300):
+    # Keys are indexed for delete_prefix/delete_pattern at each separator,
+    # so 'user:42:profile' is found under 'user:' and 'user:42:'
+    KEY_SEPARATOR = ':'
+    
+    def __init__(self, max_size: int = 100, default_ttl: int = 300,
+                 max_bytes: Optional[int] = None, sizer: Union[str, Callable[[Any], int]] = 'deep',
+                 compress: bool = False,
+                 eviction: Union[str, Callable[['SimpleCache'], EvictionPolicy]] = 'lru',
+                 metrics: bool = False):
         """
         Initialize the cache
         
         Args:
             max_size: Maximum number of items to store
             default_ttl: Default time-to-live in seconds
+            max_bytes: Optional memory budget; entries are evicted to stay under it
+            sizer: How to measure values for max_bytes: 'deep' (recursive
+                   sys.getsizeof), 'len' (for bytes/str) or a function
+            compress: Store values pickled and zlib-compressed (sized as stored)
+            eviction: 'lru', 'lfu', 'arc', 'w-tinylfu' (scan resistant), 'gds'
+                      (GreedyDual-Size, uses put's cost) or an EvictionPolicy class
+            metrics: Count events and time get/put/delete (see stats and prometheus_text)
         """
+        if isinstance(eviction, str):
+            if eviction not in EVICTION_POLICIES:
+                raise ValueError(f"Unknown eviction policy '{eviction}', "
+                                 f"expected one of {sorted(EVICTION_POLICIES)}")
+            eviction = EVICTION_POLICIES[eviction]
         self.max_size = max_size
         self.default_ttl = default_ttl
-        self._data = {}  # Stores the actual cached values
-        self._timestamps = {}  # Stores when items were added
-        self._access_order = []  # For LRU (Least Recently Used) eviction
+        self.max_bytes = max_bytes
+        self.sizer = SIZERS[sizer] if isinstance(sizer, str) else sizer
+        self.compress = compress
+        # Sum of entry sizes; values are only measured when max_bytes is set
+        self.bytes_used = 0
+        # Entries in insertion order (LRUPolicy keeps it in recency order)
+        self._data = OrderedDict()
+        # Min-heap of (expires, key); entries for overwritten or removed keys are
+        # skipped when popped, so expiry never scans the whole cache
+        self._expiry_heap = []
+        self._policy = eviction(self)
+        # Lazily restored snapshot records, moved into the cache on first get:
+        # key -> record number, and the batches holding the records by number
+        self._pending = {}
+        self._pending_batches = []
+        self._pending_starts = []
+        self._pending_next = 0
+        self._snapshot_thread = None
+        self._snapshot_stop = None
+        self._snapshot_lock = None
+        # Namespace prefix -> keys under it; built on the first prefix delete
+        self._key_index = None
+        # Instrumentation; with no metrics and no listeners the only cost is
+        # one attribute check per event
+        self.metrics = CacheMetrics() if metrics else None
+        self._listeners = []
+        self._observed = metrics
+        if metrics:
+            # Instance attributes shadow the methods, so uninstrumented caches
+            # never pay for the timing
+            self.get = self._timed('get', self.get)
+            self.put = self._timed('put', self.put)
+            self.delete = self._timed('delete', self.delete)
+            self.get_many = self._timed('get_many', self.get_many)
+            self.put_many = self._timed('put_many', self.put_many)
+            self.delete_many = self._timed('delete_many', self.delete_many)
     
-    def put(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+    def add_listener(self, listener: Callable[[str, Optional[str], dict], None]) -> None:
+        """
+        Call listener(event, key, info) for every cache event
+        
+        Events are 'put', 'hit', 'miss', 'expire', 'evict', 'reject', 'delete',
+        'clear', 'restore' and 'error'; info holds event details such as the
+        miss reason or the evicting policy. Listeners run inline, so they
+        should be quick (see print_listener and logging_listener).
+        """
+        self._listeners.append(listener)
+        self._observed = True
+    
+    def remove_listener(self, listener: Callable[[str, Optional[str], dict], None]) -> None:
+        """Stop calling a listener added with add_listener"""
+        self._listeners.remove(listener)
+        self._observed = self.metrics is not None or bool(self._listeners)
+    
+    def put(self, key: str, value: Any, ttl: Optional[int] = None, cost: float = 1.0) -> None:
         """
         Store a value in the cache
         
@@ -37,6 +852,7 @@ class SimpleCache:
             key: The cache key
             value: The value to store  
             ttl: Time-to-live override (optional)
+            cost: How expensive the value is to recompute (used by 'gds' eviction)
         """
         # Use default TTL if none provided
         if ttl is None:
@@ -45,26 +861,37 @@ class SimpleCache:
         current_time = time.time()
         
         # Remove expired items first
-        self._cleanup_expired()
-        
-        # If cache is full, remove least recently used item
-        if len(self._data) >= self.max_size and key not in self._data:
-            self._evict_lru()
-        
-        # Store the new item
-        self._data[key] = value
-        self._timestamps[key] = {
-            'created': current_time,
-            'expires': current_time + ttl,
-            'last_accessed': current_time
-        }
+        self._cleanup_expired(current_time)
+        
+        if self.compress:
+            value = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        size = 0
+        if self.max_bytes is not None:
+            size = len(value) if self.compress else self.sizer(value)
+            if size > self.max_bytes:
+                self._reject(key, size)
+                return
         
-        # Update access order
-        if key in self._access_order:
-            self._access_order.remove(key)
-        self._access_order.append(key)
+        # Store the new item, then evict until the cache fits again
+        entry = _Entry(value, current_time, current_time + ttl, size, cost)
+        self._set_entry(key, entry)
+        self._schedule_expiry(key, entry.expires)
         
-        print(f"Cached '{key}' (expires in {ttl}s)")
+        while len(self._data) > self.max_size or (
+                self.max_bytes is not None and self.bytes_used > self.max_bytes):
+            victim = self._policy.victim(key)
+            if victim is None:
+                break
+            self._remove_key(victim, evicted=True)
+            if victim == key:
+                if self._observed:
+                    self._event('reject', key, reason='not admitted', policy=self._policy.name)
+                return
+            if self._observed:
+                self._event('evict', victim, policy=self._policy.name)
+        
+        if self._observed:
+            self._event('put', key, ttl=ttl)
     
     def get(self, key: str) -> Optional[Any]:
         """
@@ -76,25 +903,35 @@ class SimpleCache:
         Returns:
             The cached value or None if not found/expired
         """
-        if key not in self._data:
-            print(f"Cache miss: '{key}' not found")
+        entry = self._data.get(key)
+        if entry is None and self._pending and key in self._pending:
+            entry = self._restore_pending(key)
+        if entry is None:
+            if self._observed:
+                self._event('miss', key, reason='not found')
+            self._policy.on_miss(key)
             return None
         
         current_time = time.time()
         
         # Check if item has expired
-        if current_time > self._timestamps[key]['expires']:
-            print(f"Cache miss: '{key}' has expired")
+        if current_time > entry.expires:
+            if self._observed:
+                self._event('expire', key, reason='get')
+                self._event('miss', key, reason='expired')
             self._remove_key(key)
+            self._policy.on_miss(key)
             return None
         
         # Update last accessed time and access order
-        self._timestamps[key]['last_accessed'] = current_time
-        self._access_order.remove(key)
-        self._access_order.append(key)
+        entry.last_accessed = current_time
+        self._policy.on_access(key, entry)
         
-        print(f"Cache hit: '{key}'")
-        return self._data[key]
+        if self._observed:
+            self._event('hit', key)
+        if self.compress:
+            return pickle.loads(zlib.decompress(entry.value))
+        return entry.value
     
     def delete(self, key: str) -> bool:
         """
@@ -106,63 +943,1063 @@ class SimpleCache:
         Returns:
             True if item was removed, False if not found
         """
-        if key in self._data:
+        self._pending.pop(key, None)
+        found = key in self._data
+        if found:
             self._remove_key(key)
-            print(f"Deleted '{key}' from cache")
-            return True
-        else:
-            print(f"Cannot delete '{key}': not found in cache")
-            return False
+        if self._observed:
+            self._event('delete', key, found=found)
+        return found
+    
+    def get_many(self, keys: Iterable[str]) -> dict:
+        """
+        Retrieve several values at once
+        
+        The clock is read once for the whole batch, and the policy's access
+        bookkeeping runs in one tight loop instead of one call per key.
+        
+        Args:
+            keys: The cache keys
+            
+        Returns:
+            Dict of the keys that were found (missing and expired keys are left out)
+        """
+        current_time = time.time()
+        data = self._data
+        pending = self._pending
+        policy = self._policy
+        observed = self._observed
+        found = {}
+        
+        for key in keys:
+            entry = data.get(key)
+            if entry is None and pending and key in pending:
+                entry = self._restore_pending(key)
+            if entry is None:
+                if observed:
+                    self._event('miss', key, reason='not found')
+                policy.on_miss(key)
+                continue
+            if current_time > entry.expires:
+                if observed:
+                    self._event('expire', key, reason='get')
+                    self._event('miss', key, reason='expired')
+                self._remove_key(key)
+                policy.on_miss(key)
+                continue
+            entry.last_accessed = current_time
+            policy.on_access(key, entry)
+            if observed:
+                self._event('hit', key)
+            found[key] = entry.value
+        
+        if self.compress:
+            for key, value in found.items():
+                found[key] = pickle.loads(zlib.decompress(value))
+        return found
+    
+    def put_many(self, items: Union[Mapping[str, Any], Iterable[tuple]],
+                 ttl: Optional[int] = None, cost: float = 1.0) -> None:
+        """
+        Store several values at once with the same TTL and cost
+        
+        Expired entries are cleaned up once before the batch and the cache
+        is evicted back within its limits once after it, so a batch larger
+        than max_size keeps its last max_size items (under LRU).
+        
+        Args:
+            items: Mapping or (key, value) pairs to store
+            ttl: Time-to-live override (optional)
+            cost: How expensive the values are to recompute (used by 'gds' eviction)
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+        if isinstance(items, Mapping):
+            items = items.items()
+        
+        current_time = time.time()
+        expires = current_time + ttl
+        self._cleanup_expired(current_time)
+        data = self._data
+        stored = []
+        
+        for key, value in items:
+            if self.compress:
+                value = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            size = 0
+            if self.max_bytes is not None:
+                size = len(value) if self.compress else self.sizer(value)
+                if size > self.max_bytes:
+                    self._reject(key, size)
+                    continue
+            self._set_entry(key, _Entry(value, current_time, expires, size, cost))
+            self._schedule_expiry(key, expires)
+            stored.append(key)
+        
+        self._evict_to_fit(None)
+        if self._observed:
+            for key in stored:
+                if key in data:
+                    self._event('put', key, ttl=ttl)
+    
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """
+        Remove several items from the cache
+        
+        Args:
+            keys: The cache keys
+            
+        Returns:
+            Number of items that were removed
+        """
+        data = self._data
+        pending = self._pending
+        observed = self._observed
+        removed = 0
+        for key in keys:
+            if pending:
+                pending.pop(key, None)
+            found = key in data
+            if found:
+                self._remove_key(key)
+                removed += 1
+            if observed:
+                self._event('delete', key, found=found)
+        return removed
+    
+    def delete_prefix(self, prefix: str) -> int:
+        """
+        Remove every key that starts with prefix, e.g. 'user:'
+        
+        Keys are looked up in an index of their separator-terminated
+        prefixes (built on first use and kept up to date afterwards), so only
+        the matching namespace is visited, not the whole cache.
+        
+        Returns:
+            Number of items that were removed
+        """
+        if self._pending:
+            for key in [key for key in self._pending
+                        if isinstance(key, str) and key.startswith(prefix)]:
+                del self._pending[key]
+        return self.delete_many(self._keys_with_prefix(prefix))
+    
+    def delete_pattern(self, pattern: str) -> int:
+        """
+        Remove every key matching a glob pattern, e.g. 'user:*' or 'user:*:session'
+        
+        Only keys under the pattern's literal prefix (the text before its
+        first wildcard) are checked, using the same index as delete_prefix.
+        
+        Returns:
+            Number of items that were removed
+        """
+        literal = pattern
+        for wildcard in '*?[':
+            position = literal.find(wildcard)
+            if position != -1:
+                literal = literal[:position]
+        if self._pending:
+            for key in [key for key in self._pending
+                        if isinstance(key, str) and fnmatch.fnmatchcase(key, pattern)]:
+                del self._pending[key]
+        return self.delete_many([key for key in self._keys_with_prefix(literal)
+                                 if fnmatch.fnmatchcase(key, pattern)])
     
     def clear(self) -> None:
         """Remove all items from the cache"""
         self._data.clear()
-        self._timestamps.clear()
-        self._access_order.clear()
-        print("Cache cleared")
+        self._expiry_heap.clear()
+        self._drop_pending()
+        self._policy.clear()
+        self._key_index = None
+        self.bytes_used = 0
+        if self._observed:
+            self._event('clear', None)
     
     def stats(self) -> dict:
-        """Get cache statistics"""
-        current_time = time.time()
-        expired_count = 0
+        """
+        Get cache statistics
         
-        for key, timestamp_data in self._timestamps.items():
-            if current_time > timestamp_data['expires']:
-                expired_count += 1
+        Entries that are due are purged from the front of the expiry heap
+        first (expired_items says how many), so the counts describe live
+        entries without scanning the cache. With metrics=True the event
+        counters and hit_ratio are included.
+        """
+        expired_count = self._cleanup_expired()
         
-        return {
+        stats = {
             'total_items': len(self._data),
             'max_size': self.max_size,
             'expired_items': expired_count,
-            'utilization': len(self._data) / self.max_size * 100
+            'utilization': len(self._data) / self.max_size * 100,
+            'bytes_used': self.bytes_used,
+            'max_bytes': self.max_bytes
         }
+        if self.metrics is not None:
+            stats.update(self.metrics.counts)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+    
+    def save_snapshot(self, path: str, lock: Optional[ContextManager] = None) -> int:
+        """
+        Write all unexpired entries to a binary snapshot file
+        
+        Entries are copied in one step (while holding lock, if given) and
+        then written batch by batch to a temp file that replaces path, so
+        readers never see a partial file. Lazily restored records that were
+        never read are written too.
+        
+        Args:
+            path: Snapshot file to write
+            lock: Lock that every thread using the cache holds around its calls
+            
+        Returns:
+            Number of entries written
+        """
+        written = 0
+        with _gc_paused():
+            with lock if lock is not None else contextlib.nullcontext():
+                current_time = time.time()
+                records = self._snapshot_records()
+            with _atomic_file(path, 'wb') as f:
+                f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.compress, current_time))
+                for start in range(0, len(records), SNAPSHOT_BATCH_SIZE):
+                    written += self._write_snapshot_batch(
+                        f, records[start:start + SNAPSHOT_BATCH_SIZE], current_time)
+                f.write(_BATCH_LENGTH.pack(0))
+        return written
     
-    def _cleanup_expired(self) -> None:
-        """Remove all expired items from cache"""
+    def restore(self, path: str, lazy: bool = False) -> int:
+        """
+        Load entries from a snapshot written by save_snapshot
+        
+        Entries whose TTL ran out since the snapshot was taken are skipped,
+        and so are keys already in the cache (their values are newer). With
+        lazy=True only the keys are loaded up front; a batch's values are
+        unpickled when one of its keys is first read, and records only move
+        into the cache then (pending keys do not count towards stats or
+        max_size until that happens).
+        
+        Args:
+            path: Snapshot file to read
+            lazy: Defer inserting entries until they are requested
+            
+        Returns:
+            Number of entries restored
+        """
         current_time = time.time()
-        expired_keys = []
+        restored = 0
+        skipped = 0
+        with _gc_paused(), open(path, 'rb') as f:
+            magic, compressed, written_at = _SNAPSHOT_HEADER.unpack(f.read(_SNAPSHOT_HEADER.size))
+            if magic not in (SNAPSHOT_MAGIC, _SNAPSHOT_MAGIC_V1):
+                raise ValueError(f"{path} is not a SimpleCache snapshot")
+            # Remaining TTLs were measured when the snapshot was written
+            elapsed = current_time - written_at
+            for keys, remaining, sizes, costs, values in _read_snapshot_batches(f, magic):
+                # Record positions to restore, or None for the whole batch
+                live = None
+                if keys and min(remaining) <= elapsed:
+                    live = [i for i, ttl in enumerate(remaining) if ttl > elapsed]
+                    skipped += len(keys) - len(live)
+                if lazy and self._data:
+                    live = [i for i in (range(len(keys)) if live is None else live)
+                            if keys[i] not in self._data]
+                if lazy:
+                    batch = _PendingBatch(self._pending_next, written_at, remaining, sizes, costs,
+                                          values, compressed)
+                    numbers = range(batch.start, batch.start + len(keys))
+                    if live is None:
+                        self._pending.update(zip(keys, numbers))
+                    else:
+                        self._pending.update((keys[i], numbers[i]) for i in live)
+                    self._pending_batches.append(batch)
+                    self._pending_starts.append(batch.start)
+                    self._pending_next += len(keys)
+                    restored += len(keys) if live is None else len(live)
+                    continue
+                if isinstance(values, bytes):
+                    values = pickle.loads(values)
+                columns = (keys, remaining, sizes, costs, values)
+                if live is not None:
+                    columns = [[column[i] for i in live] for column in columns]
+                restored += self._restore_batch(*columns, written_at, compressed, current_time)
+        
+        if not lazy:
+            heapq.heapify(self._expiry_heap)
+            self._evict_to_fit(None)
+        if self._observed:
+            self._event('restore', None, path=path, restored=restored, skipped=skipped)
+        return restored
+    
+    def enable_snapshots(self, path: str, interval: float = 60,
+                         lock: Optional[ContextManager] = None) -> None:
+        """
+        Save a snapshot every interval seconds from a background thread and at exit
+        
+        SimpleCache has no lock of its own, so the thread copies the entries
+        while holding lock, which every other thread must hold around its
+        cache calls while snapshots are on (writing the file happens
+        outside it). Failed snapshots are reported as 'error' events, or
+        logged when there are no listeners, and retried next interval.
+        
+        Args:
+            path: Snapshot file to write
+            interval: Seconds between snapshots
+            lock: The lock shared with the cache's users (default: a new
+                  lock, available as snapshot_lock)
+        """
+        self.disable_snapshots(final=False)
+        stop = threading.Event()
+        if lock is None:
+            lock = threading.Lock()
         
-        for key, timestamp_data in self._timestamps.items():
-            if current_time > timestamp_data['expires']:
-                expired_keys.append(key)
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.save_snapshot(path, lock)
+                except Exception as error:
+                    self._snapshot_failed(path, error)
+        
+        self._snapshot_stop = stop
+        self._snapshot_path = path
+        self._snapshot_lock = lock
+        self._snapshot_thread = threading.Thread(target=run, name='cache-snapshot', daemon=True)
+        self._snapshot_thread.start()
+        atexit.register(self.disable_snapshots)
+    
+    def disable_snapshots(self, final: bool = True) -> None:
+        """Stop periodic snapshots, writing one last snapshot unless final is False"""
+        if self._snapshot_thread is None:
+            return
+        self._snapshot_stop.set()
+        self._snapshot_thread.join()
+        self._snapshot_thread = None
+        atexit.unregister(self.disable_snapshots)
+        lock, self._snapshot_lock = self._snapshot_lock, None
+        if final:
+            self.save_snapshot(self._snapshot_path, lock)
+    
+    @property
+    def snapshot_lock(self) -> Optional[ContextManager]:
+        """Lock to hold around cache calls while periodic snapshots are on (else None)"""
+        return self._snapshot_lock
+    
+    def _snapshot_failed(self, path: str, error: BaseException) -> None:
+        if self._observed:
+            self._event('error', None, action='Snapshot', path=path, error=error)
+        if not self._listeners:
+            # Nobody else would see the background thread fail
+            info = {'action': 'Snapshot', 'path': path, 'error': error}
+            logging.getLogger(__name__).warning(format_event('error', None, info))
+    
+    def _snapshot_records(self) -> list:
+        """(key, expires, size, cost, value) for every entry and pending record"""
+        records = [(key, entry.expires, entry.size, entry.cost, entry.value)
+                   for key, entry in self._data.items()]
+        for key, number in self._pending.items():
+            batch, index = self._pending_batch(number)
+            expires, size, cost, value = batch.record(index)
+            if batch.compressed != self.compress:
+                value = self._convert_snapshot_value(value, batch.compressed)
+            records.append((key, expires, size, cost, value))
+        return records
+    
+    def _convert_snapshot_value(self, value: Any, compressed: bool) -> Any:
+        """Convert a snapshot value between compressed and plain storage"""
+        if compressed:
+            return pickle.loads(zlib.decompress(value))
+        return zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    
+    def _write_snapshot_batch(self, file, records: list, current_time: float) -> int:
+        """Write the unexpired (key, expires, size, cost, value) records as one batch"""
+        records = [record for record in records if record[1] > current_time]
+        if not records:
+            return 0
+        keys, expires, sizes, costs, values = zip(*records)
+        columns = (list(keys), array('d', [when - current_time for when in expires]),
+                   array('q', sizes), array('d', costs))
+        for part in (columns, list(values)):
+            data = pickle.dumps(part, pickle.HIGHEST_PROTOCOL)
+            file.write(_BATCH_LENGTH.pack(len(data)))
+            file.write(data)
+        return len(records)
+    
+    def _restore_batch(self, keys: list, remaining, sizes, costs, values: list,
+                       written_at: float, compressed: bool, current_time: float) -> int:
+        """Bulk-insert one snapshot batch without per-key cleanup, eviction or heap pushes"""
+        data = self._data
+        heap = self._expiry_heap
+        pending = self._pending
+        policy = self._policy
+        # LRU needs no insert bookkeeping, so skip the call per key
+        on_insert = None if type(policy).on_insert is EvictionPolicy.on_insert else policy.on_insert
+        convert = compressed != self.compress
+        restored = 0
+        added_bytes = 0
+        for key, ttl, size, cost, value in zip(keys, remaining, sizes, costs, values):
+            if key in data:
+                continue
+            if pending:
+                pending.pop(key, None)
+            if convert:
+                value = self._convert_snapshot_value(value, compressed)
+            expires = written_at + ttl
+            entry = _Entry(value, current_time, expires, size, cost)
+            data[key] = entry
+            heap.append((expires, key))
+            if on_insert is not None:
+                on_insert(key, entry)
+            added_bytes += size
+            restored += 1
+        self.bytes_used += added_bytes
+        if self._key_index is not None:
+            for key in keys:
+                self._index_key(key)
+        return restored
+    
+    def _insert_restored(self, key: str, value: Any, created: float, expires: float,
+                         size: int, cost: float) -> None:
+        """Insert a restored entry without put's per-key cleanup, eviction and heap push"""
+        self._set_entry(key, _Entry(value, created, expires, size, cost))
+        self._expiry_heap.append((expires, key))
+    
+    def _pending_batch(self, number: int) -> tuple:
+        """The pending batch holding a record number, and the record's index in it"""
+        batch = self._pending_batches[bisect.bisect_right(self._pending_starts, number) - 1]
+        return batch, number - batch.start
+    
+    def _drop_pending(self) -> None:
+        self._pending.clear()
+        self._pending_batches.clear()
+        self._pending_starts.clear()
+    
+    def _restore_pending(self, key: str) -> Optional[_Entry]:
+        """Move one lazily restored record into the cache"""
+        batch, index = self._pending_batch(self._pending.pop(key))
+        expires, size, cost, value = batch.take(index)
+        if not self._pending:
+            self._drop_pending()
+        current_time = time.time()
+        if expires <= current_time:
+            return None
+        if batch.compressed != self.compress:
+            value = self._convert_snapshot_value(value, batch.compressed)
+        self._insert_restored(key, value, current_time, expires, size, cost)
+        self._expiry_heap.pop()
+        self._schedule_expiry(key, expires)
+        self._evict_to_fit(key)
+        return self._data.get(key)
+    
+    def _set_entry(self, key: str, entry: _Entry) -> None:
+        """Store an entry; an existing key is updated in place so the policy keeps its history"""
+        if self._pending:
+            # A lazily restored record for the key is older than this write
+            self._pending.pop(key, None)
+        old = self._data.get(key)
+        self._data[key] = entry
+        self.bytes_used += entry.size
+        if old is None:
+            self._policy.on_insert(key, entry)
+            if self._key_index is not None:
+                self._index_key(key)
+        else:
+            self.bytes_used -= old.size
+            self._policy.on_update(key, old, entry)
+    
+    def _evict_to_fit(self, incoming: Optional[str]) -> None:
+        """Evict entries until the cache is within max_size and max_bytes"""
+        while len(self._data) > self.max_size or (
+                self.max_bytes is not None and self.bytes_used > self.max_bytes):
+            victim = self._policy.victim(incoming)
+            if victim is None:
+                break
+            self._remove_key(victim, evicted=True)
+            if self._observed:
+                self._event('evict', victim, policy=self._policy.name)
+    
+    def _schedule_expiry(self, key: str, expires: float) -> None:
+        """Add a key to the expiry heap, compacting it when stale entries pile up"""
+        heapq.heappush(self._expiry_heap, (expires, key))
+        if len(self._expiry_heap) > 2 * len(self._data) + 64:
+            self._expiry_heap = [(entry.expires, k) for k, entry in self._data.items()]
+            heapq.heapify(self._expiry_heap)
+    
+    def _cleanup_expired(self, current_time: Optional[float] = None) -> int:
+        """Remove expired items, popping only the due end of the expiry heap"""
+        if current_time is None:
+            current_time = time.time()
+        heap = self._expiry_heap
+        removed = 0
         
-        for key in expired_keys:
+        while heap and heap[0][0] < current_time:
+            expires, key = heapq.heappop(heap)
+            entry = self._data.get(key)
+            # Skip heap entries left behind by overwrites and removals
+            if entry is None or entry.expires != expires:
+                continue
             self._remove_key(key)
-            print(f"Auto-removed expired key: '{key}'")
-    
-    def _evict_lru(self) -> None:
-        """Remove the least recently used item"""
-        if self._access_order:
-            lru_key = self._access_order[0]
-            self._remove_key(lru_key)
-            print(f"Evicted LRU key: '{lru_key}'")
-    
-    def _remove_key(self, key: str) -> None:
-        """Helper method to remove a key from all data structures"""
-        self._data.pop(key, None)
-        self._timestamps.pop(key, None)
-        if key in self._access_order:
-            self._access_order.remove(key)
+            removed += 1
+            if self._observed:
+                self._event('expire', key, reason='cleanup')
+        return removed
+    
+    def _event(self, event: str, key: Optional[str], **info) -> None:
+        """Count an event and pass it to the listeners (callers check _observed first)"""
+        if self.metrics is not None:
+            self.metrics.count(event)
+        for listener in self._listeners:
+            listener(event, key, info)
+    
+    def _timed(self, op: str, method: Callable) -> Callable:
+        """Wrap a bound method so each call is recorded in the op's latency histogram"""
+        histogram = self.metrics.latency[op]
+        perf_counter = time.perf_counter
+        
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+        
+        return timed
+    
+    def _reject(self, key: str, size: int) -> None:
+        """Refuse a value over max_bytes; the key's old value goes too, as it was replaced"""
+        self._pending.pop(key, None)
+        self._remove_key(key)
+        if self._observed:
+            self._event('reject', key, reason='too large', size=size,
+                        max_bytes=self.max_bytes)
+    
+    def _remove_key(self, key: str, evicted: bool = False) -> None:
+        """Helper method to remove a key (its expiry heap entry goes stale)"""
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes_used -= entry.size
+            self._policy.on_remove(key, entry, evicted)
+            if self._key_index is not None:
+                self._unindex_key(key)
+    
+    def _namespaces(self, key: Any):
+        """Yield every separator-terminated prefix of a key ('a:b:c' gives 'a:', 'a:b:')"""
+        if not isinstance(key, str):
+            return
+        separator = self.KEY_SEPARATOR
+        end = key.find(separator)
+        while end != -1:
+            end += len(separator)
+            yield key[:end]
+            end = key.find(separator, end)
+    
+    def _index_key(self, key: Any) -> None:
+        index = self._key_index
+        for namespace in self._namespaces(key):
+            keys = index.get(namespace)
+            if keys is None:
+                index[namespace] = keys = set()
+            keys.add(key)
+    
+    def _unindex_key(self, key: Any) -> None:
+        index = self._key_index
+        for namespace in self._namespaces(key):
+            keys = index.get(namespace)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[namespace]
+    
+    def _keys_with_prefix(self, prefix: str) -> list:
+        """Cached keys starting with prefix, looked up in the narrowest indexed namespace"""
+        if self._key_index is None:
+            self._key_index = {}
+            for key in self._data:
+                self._index_key(key)
+        cut = prefix.rfind(self.KEY_SEPARATOR)
+        if cut == -1:
+            # No namespace to narrow it down: only top-level prefixes scan
+            return [key for key in self._data if isinstance(key, str) and key.startswith(prefix)]
+        namespace = prefix[:cut + len(self.KEY_SEPARATOR)]
+        keys = self._key_index.get(namespace, ())
+        if namespace == prefix:
+            return list(keys)
+        return [key for key in keys if key.startswith(prefix)]
+
+class ConcurrentCache:
+    """A thread-safe cache that spreads keys over independently locked SimpleCache shards
+
+    Threads working on different shards never wait for each other. Each shard
+    keeps its own LRU order and expiry heap, so max_size is enforced per shard
+    (max_size / shards each) and LRU eviction is approximate across the cache.
+    """
+
+    # Wrappers such as LoadingCache skip their own locking for thread-safe caches
+    thread_safe = True
+
+    def __init__(self, max_size: int = 100, default_ttl: int = 300, shards: int = 16,
+                 max_bytes: Optional[int] = None, **options):
+        """
+        Initialize the cache
+        
+        Args:
+            max_size: Maximum number of items to store (split evenly over shards)
+            default_ttl: Default time-to-live in seconds
+            shards: Number of independently locked segments
+            max_bytes: Optional memory budget (split evenly over shards)
+            **options: Other SimpleCache options (sizer, compress, eviction, metrics)
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        shard_size = max(1, -(-max_size // shards))
+        shard_bytes = None if max_bytes is None else max(1, max_bytes // shards)
+        self._shards = [SimpleCache(shard_size, default_ttl, shard_bytes, **options)
+                        for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+    
+    def _shard(self, key: str) -> int:
+        return hash(key) % len(self._shards)
+    
+    @property
+    def metrics(self) -> Optional[CacheMetrics]:
+        """Counters and latency histograms merged over all shards (None without metrics=True)"""
+        if self._shards[0].metrics is None:
+            return None
+        merged = CacheMetrics()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                merged.merge(shard.metrics)
+        return merged
+    
+    def add_listener(self, listener: Callable[[str, Optional[str], dict], None]) -> None:
+        """Add a listener to every shard (it is called while that shard's lock is held)"""
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.add_listener(listener)
+    
+    def remove_listener(self, listener: Callable[[str, Optional[str], dict], None]) -> None:
+        """Remove a listener from every shard"""
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.remove_listener(listener)
+    
+    def put(self, key: str, value: Any, ttl: Optional[int] = None, cost: float = 1.0) -> None:
+        """Store a value in the cache (see SimpleCache.put)"""
+        index = self._shard(key)
+        with self._locks[index]:
+            self._shards[index].put(key, value, ttl, cost)
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Retrieve a value from the cache (see SimpleCache.get)"""
+        index = self._shard(key)
+        with self._locks[index]:
+            return self._shards[index].get(key)
+    
+    def delete(self, key: str) -> bool:
+        """Remove an item from the cache (see SimpleCache.delete)"""
+        index = self._shard(key)
+        with self._locks[index]:
+            return self._shards[index].delete(key)
+    
+    def _group(self, keys: Iterable[Any], key_of: Callable = lambda item: item) -> dict:
+        """Split items into per-shard lists so each shard lock is taken once"""
+        groups = {}
+        count = len(self._shards)
+        for item in keys:
+            groups.setdefault(hash(key_of(item)) % count, []).append(item)
+        return groups
+    
+    def get_many(self, keys: Iterable[str]) -> dict:
+        """Retrieve several values, locking each shard once (see SimpleCache.get_many)"""
+        found = {}
+        for index, shard_keys in self._group(keys).items():
+            with self._locks[index]:
+                found.update(self._shards[index].get_many(shard_keys))
+        return found
+    
+    def put_many(self, items: Union[Mapping[str, Any], Iterable[tuple]],
+                 ttl: Optional[int] = None, cost: float = 1.0) -> None:
+        """Store several values, locking each shard once (see SimpleCache.put_many)"""
+        if isinstance(items, Mapping):
+            items = items.items()
+        for index, shard_items in self._group(items, lambda item: item[0]).items():
+            with self._locks[index]:
+                self._shards[index].put_many(shard_items, ttl, cost)
+    
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Remove several items, locking each shard once (see SimpleCache.delete_many)"""
+        removed = 0
+        for index, shard_keys in self._group(keys).items():
+            with self._locks[index]:
+                removed += self._shards[index].delete_many(shard_keys)
+        return removed
+    
+    def delete_prefix(self, prefix: str) -> int:
+        """Remove every key starting with prefix from every shard"""
+        removed = 0
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                removed += shard.delete_prefix(prefix)
+        return removed
+    
+    def delete_pattern(self, pattern: str) -> int:
+        """Remove every key matching a glob pattern from every shard"""
+        removed = 0
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                removed += shard.delete_pattern(pattern)
+        return removed
+    
+    def clear(self) -> None:
+        """Remove all items from every shard"""
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+    
+    def stats(self) -> dict:
+        """Get cache statistics summed over all shards"""
+        total_items = 0
+        expired_count = 0
+        bytes_used = 0
+        counts = None
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard_stats = shard.stats()
+            total_items += shard_stats['total_items']
+            expired_count += shard_stats['expired_items']
+            bytes_used += shard_stats['bytes_used']
+            if 'hits' in shard_stats:
+                if counts is None:
+                    counts = dict.fromkeys(COUNTED_EVENTS.values(), 0)
+                for name in counts:
+                    counts[name] += shard_stats[name]
+        
+        stats = {
+            'total_items': total_items,
+            'max_size': self.max_size,
+            'expired_items': expired_count,
+            'utilization': total_items / self.max_size * 100,
+            'bytes_used': bytes_used,
+            'max_bytes': self.max_bytes,
+            'shards': len(self._shards)
+        }
+        if counts is not None:
+            stats.update(counts)
+            lookups = counts['hits'] + counts['misses']
+            stats['hit_ratio'] = counts['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+class _Loaded:
+    """A loaded value and the time until which it counts as fresh"""
+    __slots__ = ('value', 'fresh_until')
+
+    def __init__(self, value: Any, fresh_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+
+
+class LoadingCache:
+    """A read-through cache that runs at most one loader per key at a time
+
+    Concurrent callers that miss the same key wait for the one running load
+    instead of all recomputing it (no thundering herd). With stale_ttl, an
+    expired value is still returned for that many seconds while a single
+    background refresh replaces it. TTLs get +/- jitter so keys loaded
+    together do not all expire together.
+
+    The wrapped cache stores its own records for loaded keys, so those keys
+    should only be read through this class. Calls on a SimpleCache are
+    serialized by a lock; a ConcurrentCache is used without one, so its lock
+    striping still applies.
+    """
+
+    def __init__(self, cache: Optional[Any] = None, stale_ttl: float = 0,
+                 jitter: float = 0.1, refresh_workers: int = 4):
+        """
+        Initialize the loading cache
+        
+        Args:
+            cache: Cache to store values in (SimpleCache or ConcurrentCache)
+            stale_ttl: Seconds an expired value may still be served while it refreshes
+            jitter: Fraction by which each TTL is randomly lengthened or shortened
+            refresh_workers: Threads available for background refreshes
+        """
+        self.cache = cache if cache is not None else SimpleCache()
+        self.stale_ttl = stale_ttl
+        self.jitter = jitter
+        self.refresh_workers = refresh_workers
+        # Guards the in-flight table and the refresh pool only; cache calls
+        # take _cache_lock, which is a no-op for thread-safe caches
+        self._lock = threading.Lock()
+        thread_safe = getattr(self.cache, 'thread_safe', False)
+        self._cache_lock = contextlib.nullcontext() if thread_safe else threading.Lock()
+        self._inflight = {}        # key -> concurrent.futures.Future
+        self._async_inflight = {}  # key -> asyncio.Future
+        self._refresh_pool = None
+        self._tasks = set()
+        self._listeners = []
+    
+    def add_listener(self, listener: Callable[[str, Optional[str], dict], None]) -> None:
+        """
+        Call listener('error', key, info) when a background refresh fails
+        
+        Without listeners the failure is logged as a warning to this module's logger.
+        """
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[str, Optional[str], dict], None]) -> None:
+        """Stop calling a listener added with add_listener"""
+        self._listeners.remove(listener)
+    
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Return the cached value, calling loader() to fill it on a miss
+        
+        Args:
+            key: The cache key
+            loader: Function that computes the value
+            ttl: Time-to-live override (optional)
+            
+        Returns:
+            The cached or freshly loaded value (loader errors are re-raised)
+        """
+        with self._cache_lock:
+            record = self.cache.get(key)
+        if record is not None and time.time() <= record.fresh_until:
+            return record.value
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        
+        if record is not None:
+            # Stale: serve the old value, one caller starts a background refresh
+            if leader:
+                self._refresh_executor().submit(self._load, key, loader, ttl, future, True)
+            return record.value
+        if leader:
+            # A load may have finished between the miss and taking the lead
+            with self._cache_lock:
+                record = self.cache.get(key)
+            if record is not None and time.time() <= record.fresh_until:
+                future.set_result(record.value)
+                with self._lock:
+                    self._inflight.pop(key, None)
+            else:
+                self._load(key, loader, ttl, future)
+        return future.result()
+    
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                           ttl: Optional[float] = None) -> Any:
+        """
+        Asyncio version of get_or_load; loader is an async function
+        
+        All callers must share one event loop.
+        """
+        with self._cache_lock:
+            record = self.cache.get(key)
+        if record is not None and time.time() <= record.fresh_until:
+            return record.value
+        
+        future = self._async_inflight.get(key)
+        if future is None:
+            future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+            task = asyncio.ensure_future(self._aload(key, loader, ttl, future, record is not None))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        
+        if record is not None:
+            return record.value
+        # Shield so one cancelled waiter does not cancel the load for the others
+        return await asyncio.shield(future)
+    
+    def delete(self, key: str) -> bool:
+        """Remove a loaded value so the next call loads it again"""
+        with self._cache_lock:
+            return self.cache.delete(key)
+    
+    def _jittered(self, ttl: Optional[float]) -> float:
+        if ttl is None:
+            ttl = self.cache.default_ttl
+        if self.jitter:
+            ttl *= 1 + random.uniform(-self.jitter, self.jitter)
+        return ttl
+    
+    def _store(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        ttl = self._jittered(ttl)
+        record = _Loaded(value, time.time() + ttl)
+        with self._cache_lock:
+            self.cache.put(key, record, ttl + self.stale_ttl)
+    
+    def _refresh_failed(self, key: str, error: BaseException) -> None:
+        info = {'action': f"Background refresh of '{key}'", 'error': error}
+        if not self._listeners:
+            logging.getLogger(__name__).warning(format_event('error', key, info))
+        for listener in self._listeners:
+            listener('error', key, info)
+    
+    def _load(self, key: str, loader: Callable[[], Any], ttl: Optional[float],
+              future: Future, background: bool = False) -> None:
+        """Run the loader once and hand its result (or error) to every waiter"""
+        try:
+            value = loader()
+        except BaseException as error:
+            future.set_exception(error)
+            if background:
+                self._refresh_failed(key, error)
+        else:
+            self._store(key, value, ttl)
+            future.set_result(value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+    
+    async def _aload(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float],
+                     future: asyncio.Future, background: bool) -> None:
+        try:
+            value = await loader()
+        except BaseException as error:
+            future.set_exception(error)
+            if background:
+                future.exception()  # Nobody awaits a background refresh
+                self._refresh_failed(key, error)
+            if isinstance(error, asyncio.CancelledError):
+                raise
+        else:
+            self._store(key, value, ttl)
+            future.set_result(value)
+        finally:
+            self._async_inflight.pop(key, None)
+    
+    def _refresh_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._refresh_pool is None:
+                self._refresh_pool = ThreadPoolExecutor(self.refresh_workers,
+                                                        thread_name_prefix='cache-refresh')
+            return self._refresh_pool
+
+
+class _CallStats:
+    """Hit/miss counters and compute time for one cached function"""
+    __slots__ = ('hits', 'misses', 'compute_seconds')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.compute_seconds = 0.0
+
+    def info(self) -> dict:
+        calls = self.hits + self.misses
+        average = self.compute_seconds / self.misses if self.misses else 0.0
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / calls if calls else 0.0,
+            'compute_seconds': self.compute_seconds,
+            # Each hit saved roughly one average call
+            'saved_seconds': self.hits * average
+        }
+
+
+def make_key(func: Callable, args: tuple, kwargs: dict) -> tuple:
+    """Build a cache key from a function and its arguments
+
+    The key holds the arguments themselves (as functools.lru_cache does), so
+    arguments are compared by equality rather than by repr(), which can be
+    shared by unequal objects or truncated. Unhashable arguments such as
+    lists and dicts raise TypeError; pass key= to cached() for those.
+    """
+    cache_key = (f"{func.__module__}.{func.__qualname__}", args, tuple(sorted(kwargs.items())))
+    try:
+        hash(cache_key)
+    except TypeError as e:
+        raise TypeError(f"Cannot build a cache key for {func.__qualname__}: {e}; "
+                        f"pass key= to @cached for unhashable arguments") from None
+    return cache_key
+
+
+def cached(cache: Optional[Any] = None, ttl: Optional[int] = None,
+           key: Optional[Callable[..., str]] = None) -> Callable:
+    """
+    Decorator that caches a function's results, for sync and async functions
+    
+    Args:
+        cache: Cache to store results in (default: a new SimpleCache)
+        ttl: Time-to-live for results (default: the cache's default_ttl)
+        key: Function taking the call's arguments and returning the cache key
+             (default: make_key, which needs hashable arguments)
+    
+    The decorated function gets extra attributes:
+        uncached(*args, **kwargs): call without reading or writing the cache
+        refresh(*args, **kwargs): recompute and overwrite the cached result
+        cache_info(): hits, misses, hit_ratio and compute/saved seconds
+    """
+    if cache is None:
+        cache = SimpleCache()
+
+    def decorator(func: Callable) -> Callable:
+        stats = _CallStats()
+
+        def build_key(args, kwargs):
+            return key(*args, **kwargs) if key is not None else make_key(func, args, kwargs)
+
+        def lookup(cache_key):
+            # Results are stored in a 1-tuple so a cached None is still a hit
+            hit = cache.get(cache_key)
+            if hit is not None:
+                stats.hits += 1
+            return hit
+
+        def store(cache_key, result, started):
+            stats.misses += 1
+            stats.compute_seconds += time.perf_counter() - started
+            cache.put(cache_key, (result,), ttl)
+            return result
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                cache_key = build_key(args, kwargs)
+                hit = lookup(cache_key)
+                if hit is not None:
+                    return hit[0]
+                return await refresh_with_key(cache_key, args, kwargs)
+
+            async def refresh_with_key(cache_key, args, kwargs):
+                started = time.perf_counter()
+                return store(cache_key, await func(*args, **kwargs), started)
+
+            async def refresh(*args, **kwargs):
+                return await refresh_with_key(build_key(args, kwargs), args, kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key = build_key(args, kwargs)
+                hit = lookup(cache_key)
+                if hit is not None:
+                    return hit[0]
+                return refresh_with_key(cache_key, args, kwargs)
+
+            def refresh_with_key(cache_key, args, kwargs):
+                started = time.perf_counter()
+                return store(cache_key, func(*args, **kwargs), started)
+
+            def refresh(*args, **kwargs):
+                return refresh_with_key(build_key(args, kwargs), args, kwargs)
+
+        wrapper.uncached = func
+        wrapper.refresh = refresh
+        wrapper.cache_info = stats.info
+        return wrapper
+
+    return decorator
+
 
 def demo_cache_usage():
     """Demonstrate how the cache works"""
@@ -171,6 +2008,7 @@ def demo_cache_usage():
     
     # Create a cache with small size and short TTL for demo
     cache = SimpleCache(max_size=3, default_ttl=5)
+    cache.add_listener(print_listener)
     
     # Store some values
     cache.put("user:123", {"name": "Alice", "email": "alice@example.com"})